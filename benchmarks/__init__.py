@@ -0,0 +1,4 @@
+"""
+Benchmarks of the app's state hot paths, run against a local stand-in for
+the Spotify Web API
+"""
@@ -0,0 +1,205 @@
+"""
+Local stand-in for the Spotify Web API, serving fixture responses over HTTP
+with configurable latency and rate limiting
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import fixtures
+
+
+class RateLimiter:
+    """Token bucket allowing rate requests per second with bursts of up to
+    one second's worth (at least one request); exhausted requests are told
+    to retry after a second
+    """
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _page(items_for, total: int, limit: int, offset: int, href: str) -> dict:
+    end = min(total, offset + limit)
+    return {
+        'href': href,
+        'items': [items_for(i) for i in range(offset, end)],
+        'limit': limit,
+        'next': f'{href}?offset={end}&limit={limit}' if end < total else None,
+        'offset': offset,
+        'previous': None,
+        'total': total,
+    }
+
+
+class FakeSpotifyAPI:
+    """Serves a fixtures.Library on a local port. Every request is delayed
+    by latency seconds and counted per endpoint; requests beyond
+    rate_limit per second are answered with 429 and Retry-After
+    """
+    def __init__(
+            self,
+            library: fixtures.Library,
+            latency: float = 0.03,
+            rate_limit: float = 0,
+        ):
+        self.library = library
+        self.latency = latency
+        self.limiter = RateLimiter(rate_limit)
+        self.calls = Counter()
+        self.rate_limited = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def prefix(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/v1/'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status: int, body: dict | None, headers: dict = None):
+                payload = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _handle(self, method: str):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null') if length else None
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                path = url.path.removeprefix('/v1/').rstrip('/')
+
+                time.sleep(api.latency)
+                if not api.limiter.allow():
+                    api.rate_limited += 1
+                    self._respond(429, {'error': {'status': 429}}, {'Retry-After': '1'})
+                    return
+                endpoint, response = api.route(method, path, params, body)
+                api.calls[endpoint] += 1
+                if response is None:
+                    self._respond(404, {'error': {'status': 404, 'message': path}})
+                else:
+                    self._respond(200 if method == 'GET' else 201, response)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+        return Handler
+
+    def route(
+            self,
+            method: str,
+            path: str,
+            params: dict,
+            body: dict | None,
+        ) -> tuple[str, dict | None]:
+        """The endpoint name a request is counted under, and its response"""
+        library = self.library
+        limit = int(params.get('limit', 20))
+        offset = int(params.get('offset', 0))
+        parts = path.split('/')
+
+        if path == 'me':
+            return 'me', {'id': 'bench-user', 'display_name': 'bench'}
+        if path == 'me/player/devices':
+            return 'devices', {'devices': [
+                {'id': 'd1', 'is_active': True, 'name': 'Bench speaker', 'type': 'Speaker'}
+            ]}
+        if path == 'me/player/recently-played':
+            return 'recently_played', {'items': [
+                {'played_at': '2024-06-01T10:00:00Z', 'track': fixtures.track(30_000 + i)}
+                for i in range(limit)
+            ]}
+        if path == 'me/top/tracks':
+            return 'top_tracks', _page(
+                lambda i: fixtures.track(40_000 + i), 50, limit, offset, path
+            )
+        if path == 'me/tracks':
+            return 'saved_tracks', _page(
+                library.liked_item, library.liked_tracks, limit, offset, path
+            )
+        if path == 'me/playlists':
+            return 'playlists', _page(
+                library.playlist, len(library.playlist_lengths), limit, offset, path
+            )
+        if len(parts) == 3 and parts[0] == 'playlists' and parts[2] in ('items', 'tracks'):
+            playlist_index = fixtures.index_of(parts[1])
+            if method == 'POST':
+                return 'playlist_add_items', {'snapshot_id': 'bench'}
+            return 'playlist_items', _page(
+                lambda i: library.playlist_item(playlist_index, i),
+                library.playlist_lengths[playlist_index],
+                limit,
+                offset,
+                path
+            )
+        if path == 'artists':
+            ids = params.get('ids', '').split(',')
+            return 'artists', {'artists': [
+                fixtures.full_artist(fixtures.index_of(id_)) for id_ in ids if id_
+            ]}
+        if path == 'search':
+            seed = sum(map(ord, params.get('q', '')))
+            if params.get('type') == 'artist':
+                return 'search', {'artists': _page(
+                    lambda i: fixtures.full_artist(seed * 17 + i),
+                    1000, limit, offset, path
+                )}
+            return 'search', {'tracks': _page(
+                lambda i: fixtures.track(seed * 101 + i), 1000, limit, offset, path
+            )}
+        if path == 'recommendations':
+            seeds = params.get('seed_tracks', '') + params.get('seed_artists', '')
+            seed = sum(map(ord, seeds)) * 131
+            return 'recommendations', {
+                'seeds': [],
+                'tracks': [fixtures.track(seed + i * 7) for i in range(limit)],
+            }
+        if len(parts) == 3 and parts[0] == 'users' and parts[2] == 'playlists':
+            return 'create_playlist', {'id': fixtures.spotify_id('playlist', 99_999)}
+        return path, None
@@ -0,0 +1,170 @@
+"""
+Response fixtures for the stand-in Web API. Objects have the shape and
+typical size of recorded Spotify responses; they are generated
+deterministically from their index, so a library of any size can be served
+without storing it
+"""
+import functools
+import hashlib
+
+GENRES = [
+    'indie rock', 'art pop', 'shoegaze', 'dream pop', 'post-punk', 'trip hop',
+    'uk garage', 'deep house', 'jazz fusion', 'neo soul', 'alt z',
+    'bedroom pop', 'modern rock', 'chamber pop', 'folk punk', 'electronica',
+    'drum and bass', 'vaporwave', 'hyperpop', 'afrobeats', 'bossa nova',
+    'krautrock', 'math rock', 'grime', 'lo-fi beats', 'classic soul',
+]
+MARKETS = [
+    'AD', 'AR', 'AT', 'AU', 'BE', 'BR', 'CA', 'CH', 'DE', 'DK', 'ES', 'FI',
+    'FR', 'GB', 'IE', 'IT', 'JP', 'MX', 'NL', 'NO', 'NZ', 'PL', 'SE', 'US',
+]
+CATALOGUE_TRACKS = 60_000
+CATALOGUE_ARTISTS = 4_000
+CATALOGUE_ALBUMS = 8_000
+
+
+def spotify_id(kind: str, n: int) -> str:
+    """22 character id, stable for each kind and index; the index can be
+    recovered with index_of
+    """
+    digest = hashlib.blake2b(f'{kind}{n}'.encode(), digest_size=8).hexdigest()
+    return f'{kind[0]}{n:08x}{digest[:13]}'
+
+
+def index_of(spotify_id_: str) -> int:
+    return int(spotify_id_[1:9], 16)
+
+
+def _external(kind: str, id_: str) -> dict:
+    return {'spotify': f'https://open.spotify.com/{kind}/{id_}'}
+
+
+def _images(album_id: str) -> list[dict]:
+    return [
+        {
+            'url': f'https://i.scdn.co/image/ab67616d0000{code}{album_id}',
+            'width': width,
+            'height': width,
+        }
+        for code, width in (('b273', 640), ('1e02', 300), ('4851', 64))
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def simple_artist(n: int) -> dict:
+    id_ = spotify_id('artist', n)
+    return {
+        'external_urls': _external('artist', id_),
+        'href': f'https://api.spotify.com/v1/artists/{id_}',
+        'id': id_,
+        'name': f'Artist {n}',
+        'type': 'artist',
+        'uri': f'spotify:artist:{id_}',
+    }
+
+
+def full_artist(n: int) -> dict:
+    id_ = spotify_id('artist', n)
+    return {
+        **simple_artist(n),
+        'followers': {'href': None, 'total': n * 37 % 100_000},
+        'genres': [GENRES[(n * k + k) % len(GENRES)] for k in range(n % 4)],
+        'images': _images(id_),
+        'popularity': n % 100,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def album(n: int) -> dict:
+    id_ = spotify_id('album', n)
+    return {
+        'album_type': 'album',
+        'artists': [simple_artist(n % CATALOGUE_ARTISTS)],
+        'available_markets': MARKETS,
+        'external_urls': _external('album', id_),
+        'href': f'https://api.spotify.com/v1/albums/{id_}',
+        'id': id_,
+        'images': _images(id_),
+        'name': f'Album {n}',
+        'release_date': f'{1970 + n % 55}-0{1 + n % 9}-1{n % 9}',
+        'release_date_precision': 'day',
+        'total_tracks': 12,
+        'type': 'album',
+        'uri': f'spotify:album:{id_}',
+    }
+
+
+def track(n: int) -> dict:
+    n = n % CATALOGUE_TRACKS
+    id_ = spotify_id('track', n)
+    album_n = n % CATALOGUE_ALBUMS
+    return {
+        'album': album(album_n),
+        'artists': [
+            simple_artist((album_n + k * 131) % CATALOGUE_ARTISTS)
+            for k in range(1 + n % 3)
+        ],
+        'available_markets': MARKETS,
+        'disc_number': 1,
+        'duration_ms': 150_000 + n % 120_000,
+        'explicit': n % 5 == 0,
+        'external_ids': {'isrc': f'GBAAA{n:07d}'},
+        'external_urls': _external('track', id_),
+        'href': f'https://api.spotify.com/v1/tracks/{id_}',
+        'id': id_,
+        'is_local': False,
+        'name': f'Track {n}',
+        'popularity': n % 100,
+        'preview_url': f'https://p.scdn.co/mp3-preview/{id_}',
+        'track_number': 1 + n % 12,
+        'type': 'track',
+        'uri': f'spotify:track:{id_}',
+    }
+
+
+class Library:
+    """The benchmark user's library, sized like a heavy real account"""
+    def __init__(
+            self,
+            liked_tracks: int = 10_000,
+            playlists: int = 200,
+            large_playlist_tracks: int = 5_000,
+            large_playlists: int = 2,
+        ):
+        self.liked_tracks = liked_tracks
+        self.playlist_lengths = [
+            large_playlist_tracks if i < large_playlists else 20 + i * 53 % 380
+            for i in range(playlists)
+        ]
+
+    def liked_item(self, i: int) -> dict:
+        return {
+            'added_at': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00Z',
+            'track': track(i),
+        }
+
+    def playlist(self, i: int) -> dict:
+        id_ = spotify_id('playlist', i)
+        return {
+            'collaborative': False,
+            'description': f'Playlist number {i}',
+            'external_urls': _external('playlist', id_),
+            'href': f'https://api.spotify.com/v1/playlists/{id_}',
+            'id': id_,
+            'images': _images(id_),
+            'name': f'Playlist {i}',
+            'owner': {'display_name': 'bench', 'id': 'bench-user', 'type': 'user'},
+            'public': i % 2 == 0,
+            'snapshot_id': f'MTAsN{i:08d}',
+            'tracks': {'total': self.playlist_lengths[i]},
+            'type': 'playlist',
+            'uri': f'spotify:playlist:{id_}',
+        }
+
+    def playlist_item(self, playlist_index: int, i: int) -> dict:
+        return {
+            'added_at': '2023-05-01T12:00:00Z',
+            'added_by': {'id': 'bench-user', 'type': 'user'},
+            'is_local': False,
+            'track': track(playlist_index * 7919 + i * 31),
+        }
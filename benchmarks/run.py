@@ -0,0 +1,230 @@
+"""
+Benchmark the app's state hot paths against the local stand-in API.
+
+Run from the repository root:
+
+    python -m benchmarks.run [--latency 0.03] [--rate-limit 0]
+
+Each scenario is driven through the Reflex app as the frontend would drive
+it, and reports wall time, API calls, peak traced memory and the bytes of
+state sent to the client. Results are printed and written to
+bench_output.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from .fake_api import FakeSpotifyAPI
+from .fixtures import Library
+
+TOKEN = 'bench-client-token'
+
+
+class RecordingNamespace:
+    """Stands in for the websocket namespace, counting the bytes of every
+    update pushed to the client
+    """
+    def __init__(self):
+        self.bytes_sent = 0
+
+    async def emit_update(self, update, sid):
+        self.bytes_sent += len(update.json())
+
+
+class Bench:
+    def __init__(self, app, api: FakeSpotifyAPI, trace_memory: bool):
+        self.app = app
+        self.api = api
+        self.trace_memory = trace_memory
+        self.namespace = RecordingNamespace()
+        app.event_namespace = self.namespace
+        self.results = []
+
+    async def send(self, name: str, payload: dict = None):
+        """Process one event, then any events it returns, like the frontend"""
+        from reflex.app import process
+        from reflex.event import Event
+
+        event = Event(
+            token=TOKEN,
+            name=name,
+            payload=payload or {},
+            router_data={'pathname': '/', 'query': {}},
+        )
+        chained = []
+        async for update in process(self.app, event, 'bench-sid', {}, '127.0.0.1'):
+            self.namespace.bytes_sent += len(update.json())
+            chained.extend(update.events)
+        for chained_event in chained:
+            await self.send(chained_event.name, chained_event.payload)
+
+    async def wait_for_background_tasks(self):
+        while self.app.background_tasks:
+            await asyncio.sleep(0.01)
+
+    async def state(self):
+        from reflex.state import _substate_key
+        from fynesse.state import State
+
+        root = await self.app.state_manager.get_state(_substate_key(TOKEN, State))
+        return root.substates['state']
+
+    async def measure(self, name: str, scenario):
+        """Run a scenario coroutine and record its measurements"""
+        calls_before = sum(self.api.calls.values())
+        bytes_before = self.namespace.bytes_sent
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+
+        await scenario()
+        await self.wait_for_background_tasks()
+
+        wall_time = time.perf_counter() - start
+        peak_memory = 0
+        if self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        state = await self.state()
+        self.results.append({
+            'scenario': name,
+            'wall_s': wall_time,
+            'api_calls': sum(self.api.calls.values()) - calls_before,
+            'peak_mib': peak_memory / 2 ** 20,
+            'sent_kib': (self.namespace.bytes_sent - bytes_before) / 1024,
+            'state_kib': len(json.dumps(state.dict(), default=str)) / 1024,
+        })
+
+
+async def run_scenarios(bench: Bench, library: Library):
+    state = await bench.state()
+    state.auth_token_json = json.dumps({
+        'access_token': 'bench-access-token',
+        'refresh_token': 'bench-refresh-token',
+        'expires_in': 3600,
+        'expires_at': time.time() + 24 * 3600,
+    })
+    # the scenarios are measured without a device poller or library sync
+    # running alongside
+    state._device_poller_running = True
+    state._library_sync_running = True
+
+    async def initial_library_fetch():
+        await bench.send('state.state.initial_library_fetch')
+
+    async def load_all_liked_tracks():
+        await bench.send('state.state.load_all_liked_tracks')
+
+    async def fetch_genres_liked():
+        await bench.send('state.state.fetch_genres_liked')
+
+    async def fetch_tracks_for_playlist():
+        await bench.send('state.state.select_playlist', {'pl_name': 'Playlist 1'})
+
+    async def fetch_search_results():
+        for i in range(1, len('radiohead') + 1):
+            await bench.send(
+                'state.state.search_state.set_search_name',
+                {'name': 'radiohead'[:i]}
+            )
+        await bench.wait_for_background_tasks()
+        await bench.send('state.state.search_state.fetch_more_search_results')
+
+    async def fetch_recommendations():
+        playlist_state = await bench.state()
+        window = playlist_state.playlist_window
+        for track in window.tracks[:5]:
+            await bench.send(
+                'state.state.add_track_uri_to_seeds',
+                {'uri': track.uri, 'source': 'playlist'}
+            )
+        await bench.send('state.state.fetch_recommendations')
+
+    async def fetch_batch_recommendations():
+        await bench.send('state.state.fetch_batch_recommendations')
+
+    scenarios = [
+        ('initial_library_fetch', initial_library_fetch),
+        (f'load_all_liked_tracks ({library.liked_tracks})', load_all_liked_tracks),
+        (f'fetch_genres_liked ({library.liked_tracks})', fetch_genres_liked),
+        (
+            f'fetch_tracks_for_playlist ({library.playlist_lengths[1]})',
+            fetch_tracks_for_playlist
+        ),
+        ('fetch_search_results (typing)', fetch_search_results),
+        ('fetch_recommendations', fetch_recommendations),
+        ('fetch_batch_recommendations', fetch_batch_recommendations),
+    ]
+    for name, scenario in scenarios:
+        await bench.measure(name, scenario)
+
+
+def format_results(results: list[dict], args: argparse.Namespace) -> str:
+    columns = ['wall_s', 'api_calls', 'peak_mib', 'sent_kib', 'state_kib']
+    width = max(len(r['scenario']) for r in results)
+    lines = [
+        f'latency {args.latency}s, rate limit {args.rate_limit or "off"}, '
+        f'{args.liked} liked, {args.playlists} playlists, '
+        f'{args.playlist_tracks}-track playlists',
+        'scenario'.ljust(width) + ''.join(c.rjust(11) for c in columns),
+    ]
+    for r in results:
+        lines.append(
+            r['scenario'].ljust(width)
+            + f"{r['wall_s']:11.2f}{r['api_calls']:11d}{r['peak_mib']:11.1f}"
+            + f"{r['sent_kib']:11.1f}{r['state_kib']:11.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.03,
+                        help='seconds added to every API response')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='API requests allowed per second (0 for no limit)')
+    parser.add_argument('--liked', type=int, default=10_000)
+    parser.add_argument('--playlists', type=int, default=200)
+    parser.add_argument('--playlist-tracks', type=int, default=5_000)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip tracemalloc, which slows every scenario down')
+    parser.add_argument('--output', default='bench_output.txt')
+    args = parser.parse_args()
+
+    library = Library(
+        liked_tracks=args.liked,
+        playlists=args.playlists,
+        large_playlist_tracks=args.playlist_tracks,
+    )
+    api = FakeSpotifyAPI(library, latency=args.latency, rate_limit=args.rate_limit).start()
+
+    # the app reads these when imported
+    os.environ['FYNESSE_SPOTIFY_API_PREFIX'] = api.prefix
+    os.environ['FYNESSE_METADATA_STORE'] = os.path.join(
+        tempfile.mkdtemp(prefix='fynesse-bench-'),
+        'metadata.db'
+    )
+    from fynesse.fynesse import app
+
+    bench = Bench(app, api, trace_memory=not args.no_memory)
+    try:
+        asyncio.run(run_scenarios(bench, library))
+    finally:
+        api.stop()
+
+    report = format_results(bench.results, args)
+    report += f'\nrate limited responses: {api.rate_limited}'
+    report += '\nAPI calls by endpoint: ' + ', '.join(
+        f'{endpoint} {count}' for endpoint, count in api.calls.most_common()
+    )
+    print(report)
+    with open(args.output, 'w') as f:
+        f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Session activity: every event a session sends counts as activity, so the
+background tasks kept running for it only stop once it has really been idle,
+and are started again by its next event after they have
+"""
+import contextvars
+
+import reflex as rx
+from reflex.event import Event, fix_events
+from reflex.state import BaseState, StateUpdate
+
+from .state import State
+
+# events restarting the background tasks of the session whose event is
+# being processed in this context
+_restart_events: contextvars.ContextVar[list] = contextvars.ContextVar(
+    'restart_events'
+)
+
+
+class SessionActivityMiddleware(rx.Middleware):
+    """Push back an authenticated session's idle deadline on each of its
+    events, and send the client the events restarting its background tasks
+    along with the final update of the event. Events handled in the
+    background are not postprocessed, so a restart they would need waits for
+    the session's next event. postprocess returns None so that the
+    middleware after it is still run
+    """
+    async def preprocess(self, app: rx.App, state: BaseState, event: Event) -> None:
+        session = state.substates.get(State.get_name())
+        restart = []
+        if session is not None and session.app_is_authenticated:
+            restart = session._keep_session_tasks_alive()
+        _restart_events.set(restart)
+        return None
+
+    async def postprocess(
+            self,
+            app: rx.App,
+            state: BaseState,
+            event: Event,
+            update: StateUpdate,
+        ) -> None:
+        restart = _restart_events.get([])
+        if not update.final or len(restart) == 0:
+            return None
+        queued = {e.name for e in update.events}
+        update.events.extend(
+            e for e in fix_events(restart, event.token)
+            if e.name not in queued
+        )
+        _restart_events.set([])
+        return None
@@ -0,0 +1,165 @@
+"""
+Spotify OAuth token management. Sessions keep a snapshot of their token in
+local storage; the token manager holds the latest token for each refresh
+token, so concurrent events and sessions of the same user share one refresh
+"""
+import base64
+import functools
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import TTLCache
+from .client import SPOTIFY_CLIENTS
+from .constants import (
+    CLIENT_BACKOFF_FACTOR,
+    CLIENT_REQUEST_TIMEOUT_SECONDS,
+    CLIENT_RETRIES,
+    TOKEN_CACHE_MAX_ENTRIES,
+    TOKEN_CACHE_TTL_SECONDS,
+    TOKEN_LOCK_STRIPES,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+)
+
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+
+def _build_session() -> requests.Session:
+    """Requests session for the accounts service, retrying token requests
+    that fail with a connection error or server error
+    """
+    retry = Retry(
+        total=CLIENT_RETRIES,
+        read=False,
+        allowed_methods=frozenset(['POST']),
+        status_forcelist=(429, 500, 502, 503, 504),
+        backoff_factor=CLIENT_BACKOFF_FACTOR,
+    )
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(max_retries=retry))
+    return session
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_token_json(auth_token_json: str) -> dict:
+    """Token dict for a token snapshot; parsed once per distinct snapshot,
+    so the result must not be modified
+    """
+    return json.loads(auth_token_json)
+
+
+class TokenManager:
+    """Exchanges authorization codes for tokens and refreshes them. Refreshes
+    of the same token are serialized by a lock, and a refresh finding that
+    another caller already renewed the token reuses the renewed token
+    """
+    def __init__(self):
+        self._session = _build_session()
+        # latest token dict, keyed on the refresh token it was obtained with
+        self._latest = TTLCache(
+            maxsize=TOKEN_CACHE_MAX_ENTRIES,
+            ttl=TOKEN_CACHE_TTL_SECONDS,
+        )
+        self._locks = [threading.Lock() for _ in range(TOKEN_LOCK_STRIPES)]
+
+    def _request_token(self, data: dict) -> dict:
+        client_credentials = base64.b64encode((
+            os.getenv('SPOTIFY_CLIENT_ID') + ':' + os.getenv('SPOTIFY_CLIENT_SECRET')
+        ).encode()).decode('utf-8')
+        response = self._session.post(
+            TOKEN_URL,
+            data=data,
+            headers={
+                'content-type': 'application/x-www-form-urlencoded',
+                'Authorization': 'Basic ' + client_credentials,
+            },
+            timeout=CLIENT_REQUEST_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        token_dict = response.json()
+        token_dict['expires_at'] = token_dict['expires_in'] + int(time.time())
+        return token_dict
+
+    def exchange_code(self, code: str, redirect_uri: str) -> str:
+        """Token snapshot for the authorization code from a login redirect"""
+        print('Getting spotify authentication token')
+        token_dict = self._request_token({
+            'code': code,
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code',
+        })
+        self._latest.set(token_dict['refresh_token'], token_dict)
+        return json.dumps(token_dict)
+
+    def _refresh(self, token_dict: dict) -> dict:
+        refresh_token = token_dict['refresh_token']
+        lock = self._locks[hash(refresh_token) % TOKEN_LOCK_STRIPES]
+        with lock:
+            latest = self._latest.get(refresh_token, token_dict)
+            if not self._expires_soon(latest):
+                return latest
+
+            print('Refreshing Spotify authentication token')
+            new_token_dict = {
+                'refresh_token': refresh_token,
+                **self._request_token({
+                    'refresh_token': refresh_token,
+                    'grant_type': 'refresh_token',
+                }),
+            }
+            self._latest.set(refresh_token, new_token_dict)
+            self._latest.set(new_token_dict['refresh_token'], new_token_dict)
+            SPOTIFY_CLIENTS.discard(latest['access_token'])
+            return new_token_dict
+
+    @staticmethod
+    def _expires_soon(token_dict: dict) -> bool:
+        return token_dict['expires_at'] - TOKEN_REFRESH_MARGIN_SECONDS <= time.time()
+
+    def latest_token(self, auth_token_json: str) -> dict:
+        """The newest known token for a session's snapshot, without
+        refreshing it, so never blocking
+        """
+        token_dict = parse_token_json(auth_token_json)
+        latest = self._latest.get(token_dict['refresh_token'])
+        if latest is not None and latest['expires_at'] > token_dict['expires_at']:
+            return latest
+        return token_dict
+
+    def current_token(self, auth_token_json: str) -> dict:
+        """The newest known token for a session's snapshot, refreshing it
+        first if it is about to expire
+        """
+        token_dict = self.latest_token(auth_token_json)
+        if self._expires_soon(token_dict):
+            token_dict = self._refresh(token_dict)
+        return token_dict
+
+    @staticmethod
+    def _snapshot(token_dict: dict, auth_token_json: str) -> str:
+        if token_dict is parse_token_json(auth_token_json):
+            return auth_token_json
+        return json.dumps(token_dict)
+
+    def latest_token_json(self, auth_token_json: str) -> str:
+        """Snapshot of latest_token; the given snapshot itself if it is
+        still the newest
+        """
+        return self._snapshot(self.latest_token(auth_token_json), auth_token_json)
+
+    def current_token_json(self, auth_token_json: str) -> str:
+        """Snapshot of current_token; the given snapshot itself if it is
+        still the newest
+        """
+        return self._snapshot(self.current_token(auth_token_json), auth_token_json)
+
+    def access_token(self, auth_token_json: str) -> str:
+        return self.current_token(auth_token_json)['access_token']
+
+
+TOKEN_MANAGER = TokenManager()
@@ -0,0 +1,231 @@
+"""
+Registry of Spotify clients, one per access token, each backed by a pooled
+requests session so that keep-alive connections are reused between calls
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from spotipy import Spotify, SpotifyException
+from urllib3.util.retry import Retry
+
+from .constants import (
+    CLIENT_BACKOFF_FACTOR,
+    CLIENT_POOL_CONNECTIONS,
+    CLIENT_POOL_MAXSIZE,
+    CLIENT_REGISTRY_MAX_CLIENTS,
+    CLIENT_REQUEST_TIMEOUT_SECONDS,
+    CLIENT_RETRIES,
+    SPOTIFY_API_PREFIX,
+)
+from .metrics import METRICS
+from .scheduler import SCHEDULER, retry_after_seconds
+from .singleflight import SingleFlight
+
+# Overridable so the app can be pointed at a local stand-in for the API
+API_PREFIX = os.getenv('FYNESSE_SPOTIFY_API_PREFIX', SPOTIFY_API_PREFIX)
+
+# path segments naming a collection whose next segment is an object id
+_ID_COLLECTIONS = frozenset([
+    'albums', 'artists', 'audio-analysis', 'audio-features', 'episodes',
+    'playlists', 'shows', 'tracks', 'users',
+])
+
+
+def _api_path(url: str) -> tuple[str, str]:
+    """API path of a request url, and its query string"""
+    path, _, query = url.partition('?')
+    if path.startswith('http'):
+        path = path.split('/v1/', 1)[-1]
+    return path.strip('/'), query
+
+
+def endpoint_name(url: str) -> str:
+    """API path of a request url with its query and object ids removed,
+    e.g. playlists/{id}/items
+    """
+    parts = _api_path(url)[0].split('/')
+    return '/'.join(
+        '{id}' if i > 0 and parts[i - 1] in _ID_COLLECTIONS else part
+        for i, part in enumerate(parts)
+    )
+
+
+def _is_user_scoped(path: str) -> bool:
+    """Whether responses from an API path depend on whose token is used"""
+    return path == 'me' or path.startswith(('me/', 'users/', 'playlists/'))
+
+
+def request_key(url: str, params: dict, user_key: str) -> tuple:
+    """Key identifying a GET request: its path and parameters, whether
+    given in the url or separately, and the user for user-scoped paths
+    """
+    path, query = _api_path(url)
+    all_params = dict(parse_qsl(query))
+    all_params.update(
+        (name, str(value)) for name, value in params.items() if value is not None
+    )
+    return (
+        path,
+        tuple(sorted(all_params.items())),
+        user_key if _is_user_scoped(path) else None,
+    )
+
+
+class CountingRetry(Retry):
+    """Retry policy recording each retry made by the transport below
+    spotipy, by the status code (429 for rate limiting) or error behind it
+    """
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        cause = response.status if response is not None else type(error).__name__
+        METRICS.increment('api.retries')
+        METRICS.increment(f'api.retries.{cause}')
+        return super().increment(method, url, response, error, *args, **kwargs)
+
+
+# GET requests in flight, shared by every client
+_IN_FLIGHT_REQUESTS = SingleFlight()
+
+
+class ScheduledSpotify(Spotify):
+    """Spotify client sending its API calls through the request scheduler,
+    counting and timing them per endpoint. A GET request identical to one
+    already in flight, from any client, waits for that request's response
+    instead of being sent
+    """
+    def _internal_call(self, method, url, payload, params):
+        endpoint = endpoint_name(url)
+        if method != 'GET':
+            return self._scheduled_call(endpoint, method, url, payload, params)
+
+        results, shared = _IN_FLIGHT_REQUESTS.do(
+            request_key(url, params, self._auth),
+            lambda: self._scheduled_call(endpoint, method, url, payload, params)
+        )
+        if shared:
+            METRICS.increment(f'api.coalesced.{endpoint}')
+        return results
+
+    def _scheduled_call(self, endpoint, method, url, payload, params):
+        SCHEDULER.acquire(self._auth)
+        METRICS.increment(f'api.calls.{endpoint}')
+        start = time.perf_counter()
+        try:
+            return super()._internal_call(method, url, payload, params)
+        except SpotifyException as e:
+            if e.http_status == 429:
+                SCHEDULER.pause(retry_after_seconds(e))
+            METRICS.increment(f'api.errors.{e.http_status}')
+            raise
+        finally:
+            METRICS.observe(f'api.{endpoint}', time.perf_counter() - start)
+
+
+def _build_session() -> requests.Session:
+    """Requests session with a connection pool sized for concurrent calls
+    and retries with exponential backoff on transient failures. Rate limited
+    responses are not retried here but left to the request scheduler
+    """
+    retry = CountingRetry(
+        total=CLIENT_RETRIES,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=CLIENT_RETRIES,
+        backoff_factor=CLIENT_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        # otherwise any 429 carrying Retry-After is still retried here
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=CLIENT_POOL_CONNECTIONS,
+        pool_maxsize=CLIENT_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _session_connection_counts(session: requests.Session) -> tuple[int, int]:
+    """Number of connections opened and requests made by a session's pools"""
+    opened, made = 0, 0
+    adapters = {id(a): a for a in session.adapters.values()}.values()
+    for adapter in adapters:
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                made += pool.num_requests
+    return opened, made
+
+
+class SpotifyClientRegistry:
+    """Spotify clients keyed by access token. A client, and the warm
+    connection pool behind it, is built the first time a token is seen and
+    reused until the token rotates or the client is evicted
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._clients: OrderedDict[str, tuple[Spotify, requests.Session]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._retired_opened = 0
+        self._retired_requests = 0
+
+    def get(self, access_token: str) -> Spotify:
+        with self._lock:
+            if access_token in self._clients:
+                self._clients.move_to_end(access_token)
+                return self._clients[access_token][0]
+
+            session = _build_session()
+            sp = ScheduledSpotify(
+                auth=access_token,
+                requests_session=session,
+                requests_timeout=CLIENT_REQUEST_TIMEOUT_SECONDS,
+            )
+            sp.prefix = API_PREFIX
+            self._clients[access_token] = (sp, session)
+            while len(self._clients) > self.maxsize:
+                _, (_, old_session) = self._clients.popitem(last=False)
+                self._retire(old_session)
+            return sp
+
+    def discard(self, access_token: str):
+        """Drop the client for a token that has been replaced"""
+        with self._lock:
+            entry = self._clients.pop(access_token, None)
+            if entry is not None:
+                self._retire(entry[1])
+
+    def _retire(self, session: requests.Session):
+        opened, made = _session_connection_counts(session)
+        self._retired_opened += opened
+        self._retired_requests += made
+        session.close()
+
+    def connection_stats(self) -> dict:
+        """Connections opened versus reused across every client, including
+        those already retired
+        """
+        with self._lock:
+            opened, made = self._retired_opened, self._retired_requests
+            for _, session in self._clients.values():
+                session_opened, session_made = _session_connection_counts(session)
+                opened += session_opened
+                made += session_made
+            return {
+                'clients': len(self._clients),
+                'requests': made,
+                'connections_opened': opened,
+                'connections_reused': max(made - opened, 0),
+            }
+
+
+SPOTIFY_CLIENTS = SpotifyClientRegistry(maxsize=CLIENT_REGISTRY_MAX_CLIENTS)
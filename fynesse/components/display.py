@@ -1,6 +1,8 @@
 """
 Generic components for displaying information
 """
+from typing import Callable
+
 from fynesse.data import Track
 from fynesse.state import Artist, SearchState, State, Track
 
@@ -121,7 +123,7 @@ def track_card(
                                 lambda x: rx.chakra.wrap_item(artist_card(x, True))
                             ),
                         ),
-                        rx.chakra.text(track.artist_names.join(', '))
+                        rx.chakra.text(track.artist_names_text)
                     ),
                     rx.chakra.box(
                         rx.chakra.text(
@@ -160,6 +162,46 @@ def track_card(
     )
 
 
+def windowed_track_list(
+        window: rx.Var,
+        list_name: str,
+        card: Callable[[Track], rx.Component],
+    ) -> rx.Component:
+    """One window of a long track list, rendered with card, between pager
+    buttons that ask the server for the previous or next window
+    """
+    def pager() -> rx.Component:
+        return rx.cond(
+            window.has_previous | window.has_next,
+            rx.chakra.hstack(
+                rx.chakra.button(
+                    rx.chakra.icon(tag='chevron_left'),
+                    size='xs',
+                    variant='ghost',
+                    on_click=State.page_track_window(list_name, -1),
+                    is_disabled=~window.has_previous,
+                ),
+                rx.chakra.text(window.range_text, as_='small'),
+                rx.chakra.button(
+                    rx.chakra.icon(tag='chevron_right'),
+                    size='xs',
+                    variant='ghost',
+                    on_click=State.page_track_window(list_name, 1),
+                    is_disabled=~window.has_next,
+                ),
+                justify='center',
+                width='100%'
+            ),
+        )
+
+    return rx.chakra.vstack(
+        pager(),
+        rx.foreach(window.tracks, card),
+        pager(),
+        width='100%'
+    )
+
+
 def artist_card_lg(
         artist: Artist,
         show_genres: bool=False,
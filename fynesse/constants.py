@@ -55,8 +55,10 @@ PLANT_SEEDS_HINT_TEXT = 'plant some seeds'
 PLAY_ALL_TRACKS_BUTTON_TEXT = 'play all'
 ARTIST_GENRES_BUTTON_TEXT = 'see artist genres'
 LOAD_MORE_BUTTON_TEXT = 'load more'
+LOAD_ALL_BUTTON_TEXT = 'load all'
 SAVE_PLAYLIST_BUTTON_TEXT = 'save to playlist'
 GENERATE_RECOMMENDATIONS_BUTTON_TEXT = 'germinate seeds 🪴'
+GERMINATE_PLAYLIST_BUTTON_TEXT = 'germinate whole playlist 🪴'
 
 PLAYLIST_CREATE_DIALOG_HEADER_TEXT = 'new playlist'
 CREATE_PLAYLIST_BUTTON_TEXT = 'create playlist'
@@ -92,4 +94,80 @@ SEARCH_GENRE_FIELD_TEXT = 'genre'
 SEARCH_YEAR_FIELD_TEXT = 'year'
 NUM_SEARCH_RESULTS_SLIDER_TEXT = 'number of results: '
 
-SPOTIFY_GREEN = '#1DB954'
\ No newline at end of file
+SPOTIFY_GREEN = '#1DB954'
+
+DEVICE_CACHE_TTL_SECONDS = 10
+DEVICE_CACHE_MAX_ENTRIES = 1000
+DEVICE_POLL_INTERVAL_SECONDS = 15
+DEVICE_POLLER_IDLE_TIMEOUT_SECONDS = 30 * 60
+
+CLIENT_REGISTRY_MAX_CLIENTS = 500
+CLIENT_POOL_CONNECTIONS = 4
+CLIENT_POOL_MAXSIZE = 16
+CLIENT_RETRIES = 3
+CLIENT_BACKOFF_FACTOR = 0.3
+CLIENT_REQUEST_TIMEOUT_SECONDS = 10
+
+PAGINATION_MAX_WORKERS = 8
+RATE_LIMIT_MAX_ATTEMPTS = 4
+RATE_LIMIT_DEFAULT_BACKOFF_SECONDS = 5
+PLAYLISTS_PAGE_SIZE = 50
+PLAYLIST_ITEMS_PAGE_SIZE = 100
+LIBRARY_BATCH_SIZE = 50
+
+ARTISTS_CHUNK_SIZE = 50
+GENRE_CACHE_MAX_ARTISTS = 100_000
+GENRE_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+METADATA_STORE_PATH = 'fynesse_metadata.db'
+METADATA_STORE_FLUSH_THRESHOLD = 500
+METADATA_STALE_AFTER_SECONDS = 7 * 24 * 60 * 60
+SQLITE_MAX_VARIABLES = 900
+GENRE_FETCH_MAX_WORKERS = 6
+LIKED_TRACKS_LOAD_ALL_STEP = 400
+SEARCH_DEBOUNCE_SECONDS = 0.4
+
+SEARCH_CACHE_MAX_ENTRIES = 5000
+SEARCH_CACHE_TTL_SECONDS = 10 * 60
+SEARCH_HISTORY_MAX_TRACKS = 200
+
+RECOMMENDATION_CACHE_MAX_ENTRIES = 2000
+RECOMMENDATION_CACHE_TTL_SECONDS = 30 * 60
+RECOMMENDATION_TARGET_STEP = 0.05
+RECOMMENDATION_TEMPO_STEP = 2
+RECOMMENDATION_PREFETCH_DELAY_SECONDS = 1.5
+RECOMMENDATION_MAX_SEEDS = 5
+RECOMMENDATION_BATCH_MAX_GROUPS = 20
+RECOMMENDATION_BATCH_MAX_WORKERS = 8
+RECOMMENDATION_BATCH_GROUP_LIMIT = 50
+RECOMMENDATION_BATCH_MAX_TRACKS = 200
+
+PLAYLIST_ADD_ITEMS_CHUNK_SIZE = 100
+PLAYLIST_WRITE_MAX_ATTEMPTS = 4
+PLAYLIST_WRITE_RETRY_BACKOFF_SECONDS = 1
+CURRENT_USER_CACHE_MAX_ENTRIES = 1000
+CURRENT_USER_CACHE_TTL_SECONDS = 60 * 60
+ALBUM_ART_MAX_WIDTH = 300
+STATE_DELTA_WARN_BYTES = 256 * 1024
+PLAYLIST_TRACKS_MAX_PLAYLISTS = 8
+TRACK_LIST_WINDOW_SIZE = 50
+TRACK_LIST_NAMES = ['recent', 'liked', 'top', 'playlist']
+
+TOKEN_REFRESH_MARGIN_SECONDS = 120
+TOKEN_CACHE_MAX_ENTRIES = 10_000
+TOKEN_CACHE_TTL_SECONDS = 24 * 60 * 60
+TOKEN_LOCK_STRIPES = 64
+SPOTIFY_API_PREFIX = 'https://api.spotify.com/v1/'
+
+METRICS_SAMPLE_RATE = 0.1
+
+SCHEDULER_APP_RATE_PER_SECOND = 40
+SCHEDULER_APP_BURST = 80
+SCHEDULER_USER_RATE_PER_SECOND = 20
+SCHEDULER_USER_BURST = 60
+SCHEDULER_BULK_RESERVE = 0.25
+SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS = 1
+SCHEDULER_USER_BUCKET_TTL_SECONDS = 60 * 60
+
+LIBRARY_SYNC_INTERVAL_SECONDS = 10 * 60
+LIKED_TRACKS_CHECK_INTERVAL_SECONDS = 6 * 60 * 60
@@ -1,7 +1,31 @@
+import sys
+from collections import OrderedDict
+
 from spotipy import SpotifyOAuth
 import reflex as rx
+from .constants import ALBUM_ART_MAX_WIDTH
+from .store import METADATA_STORE
 from .utilities import src_set_from_images_list
 
+
+def _storable_track_dict(track_dict: dict) -> dict:
+    """The parts of an API track object needed to rebuild a Track"""
+    album_dict = track_dict['album']
+    return {
+        'uri': track_dict['uri'],
+        'name': track_dict['name'],
+        'artists': [
+            {'uri': a['uri'], 'name': a['name']}
+            for a in track_dict['artists']
+        ],
+        'album': {
+            'name': album_dict['name'],
+            'images': album_dict['images'],
+            'external_urls': album_dict['external_urls'],
+        },
+        'external_urls': track_dict['external_urls'],
+    }
+
 class Artist(rx.Base):
     uri: str
     artist_name: str
@@ -14,7 +38,7 @@ class Artist(rx.Base):
         self.genres = genres
         return self
 
-    def __init__(self, artist_dict):
+    def __init__(self, artist_dict: dict):
         uri = artist_dict['uri']
         artist_name = artist_dict['name']
         artist_url = artist_dict['external_urls']['spotify']
@@ -29,89 +53,217 @@ class Artist(rx.Base):
         )
 
 class Track(rx.Base):
+    """A track as sent to the client: only the fields a track card renders.
+    Strings repeated across many tracks, such as album details, are interned
+    so tracks of the same album share them
+    """
     uri: str
     track_name: str
     artist_uris_names: list[tuple[str, str]]
-    artist_names: list[str]
+    artist_names_text: str
     album_name: str
     album_url: str
-    album_art: list[str]
     spotify_url: str
     artist_genres: list[str] = []
     album_art_srcset: str
-    added_at: str
 
-    raw_dict: dict = None
-        
     def with_artist_genres(self, artist_genres):
         self.artist_genres = artist_genres
         return self
-    
-    @rx.var
+
+    @property
     def artist_uris(self) -> list[str]:
         return [uri for uri, name in self.artist_uris_names]
-    
+
     def __init__(
             self,
             input_dict: dict,
-            track_enclosed_in_item: bool = True
+            track_enclosed_in_item: bool = True,
+            from_store: bool = False,
         ):
-        if track_enclosed_in_item:
-            item_dict = input_dict
-            track_dict = item_dict['track']
-            added_at = item_dict['added_at']\
-                if 'added_at' in item_dict\
-                else item_dict['played_at']
+        """Build from an API track (or item enclosing a track), which is also
+        written to the metadata store. A track dict read from the store is
+        passed with from_store, so it is not written back
+        """
+        if from_store:
+            track_dict = input_dict
+        elif track_enclosed_in_item:
+            track_dict = input_dict['track']
         else:
             track_dict = input_dict
-            added_at = ''
 
+        if not from_store:
+            METADATA_STORE.stage_track(
+                track_dict['uri'],
+                _storable_track_dict(track_dict)
+            )
 
         uri = track_dict['uri']
         track_name = track_dict['name']
 
-        # print(track_name)
-
         artist_uris_names = [
-            (a['uri'], a['name']) 
+            (sys.intern(a['uri']), sys.intern(a['name']))
             for a 
             in track_dict['artists']
         ]
-        artist_names = [name for uri, name in artist_uris_names]
+        artist_names_text = ', '.join(name for uri, name in artist_uris_names)
 
-        album_name = track_dict['album']['name']
+        album_name = sys.intern(track_dict['album']['name'])
 
         if 'spotify' in track_dict['external_urls']:
             spotify_url = track_dict['external_urls']['spotify']
         else:
             spotify_url = ''
 
+        # the card shows album art at 100px wide, so larger images are
+        # never picked from the srcset
         raw_album_art = track_dict['album']['images']
+        album_art = [
+            img
+            for img in raw_album_art
+            if (img.get('width') or 0) <= ALBUM_ART_MAX_WIDTH
+        ]
+        if len(album_art) == 0 and len(raw_album_art) > 0:
+            album_art = [min(raw_album_art, key=lambda img: img.get('width') or 0)]
+        album_art_srcset = sys.intern(src_set_from_images_list(album_art))
 
-        album_art = [img['url'] for img in raw_album_art]
-
-        album_art_srcset = src_set_from_images_list(raw_album_art)
-
-        album_url = track_dict['album']['external_urls']['spotify']
+        album_url = sys.intern(track_dict['album']['external_urls']['spotify'])
         
         super().__init__(
             uri=uri,
             track_name=track_name,
             artist_uris_names=artist_uris_names,
-            artist_names=artist_names,
+            artist_names_text=artist_names_text,
             album_name=album_name,
-            album_art=album_art,
             album_url=album_url,
             album_art_srcset=album_art_srcset,
             spotify_url=spotify_url,
-            added_at=added_at
         )
 
+class TrackRegistry:
+    """A session's canonical Track objects, keyed by uri. Library views hold
+    references to the registered tracks, so a track appearing in several
+    views is stored once and can be found by uri in constant time
+    """
+    def __init__(self):
+        self._tracks: dict[str, Track] = {}
+
+    def register(self, tracks: list[Track]) -> list[Track]:
+        """Add tracks not yet known and return the registered instance for
+        each of tracks, in order
+        """
+        registered = []
+        for track in tracks:
+            existing = self._tracks.get(track.uri)
+            if existing is None:
+                self._tracks[track.uri] = track
+                registered.append(track)
+            else:
+                if len(existing.artist_genres) == 0:
+                    existing.artist_genres = track.artist_genres
+                registered.append(existing)
+        return registered
+
+    def get(self, uri: str) -> Track | None:
+        return self._tracks.get(uri)
+
+    def discard(self, uris: list[str]):
+        for uri in uris:
+            self._tracks.pop(uri, None)
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self._tracks
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+
+class TrackWindow(rx.Base):
+    """The slice of a long track list currently shown on the client"""
+    tracks: list[Track] = []
+    offset: int = 0
+    total: int = 0
+    has_previous: bool = False
+    has_next: bool = False
+    range_text: str = ''
+
+
+class TrackList:
+    """A full track list kept on the server only, of which the client is
+    sent one window at a time
+    """
+    def __init__(self, tracks: list[Track] = None):
+        self.tracks: list[Track] = list(tracks or [])
+
+    def extend(self, tracks: list[Track]):
+        self.tracks.extend(tracks)
+
+    def window(self, offset: int, size: int) -> TrackWindow:
+        """The window of size tracks starting at offset, moved back to the
+        last full window if offset is past the end of the list
+        """
+        offset = max(0, min(offset, (len(self.tracks) - 1) // size * size))
+        tracks = self.tracks[offset:offset + size]
+        return TrackWindow(
+            tracks=tracks,
+            offset=offset,
+            total=len(self.tracks),
+            has_previous=offset > 0,
+            has_next=offset + len(tracks) < len(self.tracks),
+            range_text=f'{offset + 1}-{offset + len(tracks)} of {len(self.tracks)}'
+                if len(tracks) > 0 else '',
+        )
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+
+class PlaylistTrackStore:
+    """A session's loaded playlist contents, keyed by playlist uri (names
+    change, and duplicates are renumbered) and kept on the server only. Holds at most maxsize playlists; storing another
+    evicts the least recently used
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._playlists: OrderedDict[str, list[Track]] = OrderedDict()
+
+    def get(self, uri: str) -> list[Track] | None:
+        tracks = self._playlists.get(uri)
+        if tracks is not None:
+            self._playlists.move_to_end(uri)
+        return tracks
+
+    def set(self, uri: str, tracks: list[Track]) -> dict[str, list[Track]]:
+        """Store a playlist's tracks, returning any playlists evicted to make
+        room for them, by uri
+        """
+        self._playlists[uri] = tracks
+        self._playlists.move_to_end(uri)
+        evicted = {}
+        while len(self._playlists) > self.maxsize:
+            evicted_uri, evicted_tracks = self._playlists.popitem(last=False)
+            evicted[evicted_uri] = evicted_tracks
+        return evicted
+
+    def values(self):
+        return self._playlists.values()
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self._playlists
+
+    def __len__(self) -> int:
+        return len(self._playlists)
+
+
 class Playlist(rx.Base):
     playlist_name: str
     uri: str
     description: str
     public: bool
+    snapshot_id: str = ''
     has_genres: bool = False
 
     def with_genre_flag_true(self):
@@ -131,11 +283,13 @@ class Playlist(rx.Base):
         uri = pl_dict['uri']
         description = pl_dict['description']
         public = bool(pl_dict['public'])
+        snapshot_id = pl_dict.get('snapshot_id') or ''
 
         super().__init__(
             playlist_name=playlist_name,
             uri=uri,
             description=description,
-            public=public
+            public=public,
+            snapshot_id=snapshot_id,
         )
     
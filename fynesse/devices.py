@@ -0,0 +1,31 @@
+"""
+Playback device status, cached per access token so that computed vars and
+concurrent sessions of the same user share one devices() call
+"""
+from spotipy import Spotify
+
+from .cache import TTLCache
+from .constants import DEVICE_CACHE_MAX_ENTRIES, DEVICE_CACHE_TTL_SECONDS
+from .pagination import call_respecting_rate_limit
+
+ACTIVE_DEVICES_CACHE = TTLCache(
+    maxsize=DEVICE_CACHE_MAX_ENTRIES,
+    ttl=DEVICE_CACHE_TTL_SECONDS,
+)
+
+
+def fetch_active_devices(sp: Spotify) -> list[dict]:
+    """Query the API for the user's devices, keeping only active ones"""
+    devices = call_respecting_rate_limit(sp.devices)['devices']
+    return [d for d in devices if d['is_active']]
+
+
+def cached_active_devices(sp: Spotify, access_token: str) -> list[dict]:
+    """Active devices for the user owning access_token; only hits the API
+    if the last device list for this token is older than the cache TTL
+    """
+    devices = ACTIVE_DEVICES_CACHE.get(access_token)
+    if devices is None:
+        devices = fetch_active_devices(sp)
+        ACTIVE_DEVICES_CACHE.set(access_token, devices)
+    return devices
@@ -3,7 +3,9 @@ Main app script
 """
 import reflex as rx
 
+from .activity import SessionActivityMiddleware
 from .components.display import pane
+from .instrumentation import InstrumentationMiddleware, metrics_endpoint
 from .views import *
 
 from .state import *
@@ -49,4 +51,10 @@ def index() -> rx.Component:
     )
 
 app = rx.App()
+# ahead of the default middleware, as only the first postprocess that
+# returns an update is run
+app.add_middleware(InstrumentationMiddleware(), index=0)
+# its postprocess returns None, so it can go ahead of the instrumentation
+app.add_middleware(SessionActivityMiddleware(), index=0)
+app.api.add_api_route('/metrics', metrics_endpoint)
 app.add_page(index, on_load=State.on_load)
@@ -0,0 +1,186 @@
+"""
+Artist genre lookup, backed by a cache shared by every session in the
+server process
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from spotipy import Spotify
+
+from .cache import TTLCache
+from .constants import (
+    ARTISTS_CHUNK_SIZE,
+    GENRE_CACHE_MAX_ARTISTS,
+    GENRE_FETCH_MAX_WORKERS,
+    GENRE_CACHE_TTL_SECONDS,
+    METADATA_STALE_AFTER_SECONDS,
+)
+from .data import Artist, Track
+from .pagination import call_respecting_rate_limit
+from .scheduler import BULK, INTERACTIVE, current_priority, submit_in_context
+from .store import METADATA_STORE
+from .utilities import flat_genre_list_for_artist_uris, flatten_list_of_lists
+
+ARTIST_GENRE_CACHE = TTLCache(
+    maxsize=GENRE_CACHE_MAX_ARTISTS,
+    ttl=GENRE_CACHE_TTL_SECONDS,
+)
+
+# Shared by every session, so the number of concurrent artists() calls is
+# bounded process-wide; one pool per priority, so interactive lookups never
+# queue behind a bulk genre backfill
+_GENRE_FETCH_EXECUTORS = {
+    priority: ThreadPoolExecutor(
+        max_workers=GENRE_FETCH_MAX_WORKERS,
+        thread_name_prefix=f'genre-fetch-{priority}',
+    )
+    for priority in (INTERACTIVE, BULK)
+}
+
+# Artist uris whose genres are currently being fetched, mapped to a future
+# resolving to their genres and the priority they are fetched at. Later
+# requests for the same artist wait on it, except interactive requests for
+# an artist fetched at bulk priority, which fetch it again themselves
+_in_flight: dict[str, tuple[Future, str]] = {}
+_in_flight_lock = threading.Lock()
+
+
+def _finish_in_flight(chunk: list[str], futures: dict[str, Future]):
+    """Stop sharing the futures of a chunk, unless a later request has
+    taken over an artist's entry
+    """
+    with _in_flight_lock:
+        for uri in chunk:
+            in_flight = _in_flight.get(uri)
+            if in_flight is not None and in_flight[0] is futures[uri]:
+                del _in_flight[uri]
+
+
+def _fetch_artist_chunk(
+        sp: Spotify,
+        chunk: list[str],
+        futures: dict[str, Future],
+    ):
+    """Fetch one chunk of artists and resolve the futures waiting on them"""
+    try:
+        artists = call_respecting_rate_limit(sp.artists, chunk)['artists']
+        fetched = {a['uri']: a['genres'] for a in artists if a}
+        chunk_lookup = {uri: fetched.get(uri, []) for uri in chunk}
+        for uri, genres in chunk_lookup.items():
+            ARTIST_GENRE_CACHE.set(uri, genres)
+        METADATA_STORE.upsert_artist_genres(chunk_lookup)
+    except Exception as e:
+        _finish_in_flight(chunk, futures)
+        for uri in chunk:
+            futures[uri].set_exception(e)
+        return
+
+    _finish_in_flight(chunk, futures)
+    for uri in chunk:
+        futures[uri].set_result(chunk_lookup[uri])
+
+
+def _fetch_genres_coalesced(
+        sp: Spotify,
+        a_uris: list[str],
+    ) -> dict[str, list[str]]:
+    """Fetch genres for artists not cached anywhere. Artists already being
+    fetched for another caller are waited on rather than requested again,
+    unless this caller is interactive and that one bulk; the rest are split
+    into chunks fetched concurrently on the pool for this caller's priority
+    """
+    priority = current_priority()
+    futures = {}
+    owned_uris = []
+    with _in_flight_lock:
+        for uri in a_uris:
+            in_flight = _in_flight.get(uri)
+            if in_flight is not None\
+                    and (priority == BULK or in_flight[1] == INTERACTIVE):
+                futures[uri] = in_flight[0]
+            else:
+                futures[uri] = Future()
+                _in_flight[uri] = (futures[uri], priority)
+                owned_uris.append(uri)
+
+    for i in range(0, len(owned_uris), ARTISTS_CHUNK_SIZE):
+        submit_in_context(
+            _GENRE_FETCH_EXECUTORS[priority],
+            _fetch_artist_chunk,
+            sp,
+            owned_uris[i:i + ARTISTS_CHUNK_SIZE],
+            futures,
+        )
+
+    return {uri: future.result() for uri, future in futures.items()}
+
+
+def genre_lookup_for_artist_uris(
+        sp: Spotify,
+        a_uris: list[str],
+    ) -> dict[str, list[str]]:
+    """Return a dictionary mapping each of the given artist uris to its list
+    of genres. Artists are looked up in the shared cache, then in the
+    metadata store if their stored genres are not stale; only the rest are
+    fetched from the API, in concurrent chunks, and written back to both
+    """
+    genre_lookup = {}
+    uncached_uris = []
+    for uri in set(a_uris):
+        genres = ARTIST_GENRE_CACHE.get(uri)
+        if genres is None:
+            uncached_uris.append(uri)
+        else:
+            genre_lookup[uri] = genres
+
+    stored_lookup = METADATA_STORE.get_artist_genres(
+        uncached_uris,
+        max_age=METADATA_STALE_AFTER_SECONDS
+    )
+    for uri, genres in stored_lookup.items():
+        ARTIST_GENRE_CACHE.set(uri, genres)
+    genre_lookup.update(stored_lookup)
+
+    unknown_uris = [uri for uri in uncached_uris if uri not in stored_lookup]
+    if len(unknown_uris) > 0:
+        genre_lookup.update(_fetch_genres_coalesced(sp, unknown_uris))
+
+    return genre_lookup
+
+
+def tracks_with_genres(sp: Spotify, track_list: list[Track]) -> list[Track]:
+    """Set each track's artist genres, fetching any that are not known"""
+    artist_uris = flatten_list_of_lists(
+        [
+            t.artist_uris
+            for t in track_list
+        ]
+    )
+    genre_lookup = genre_lookup_for_artist_uris(sp, artist_uris)
+
+    return [
+        track.with_artist_genres(
+            flat_genre_list_for_artist_uris(
+                track.artist_uris,
+                genre_lookup
+            )
+        )
+        for track
+        in track_list
+    ]
+
+
+def artists_with_genres(sp: Spotify, artist_list: list[Artist]) -> list[Artist]:
+    """Set each artist's genres, fetching any that are not known"""
+    genre_lookup = genre_lookup_for_artist_uris(
+        sp,
+        [a.uri for a in artist_list],
+    )
+
+    return [
+        artist.with_genres(
+            list(genre_lookup.get(artist.uri, []))
+        )
+        for artist
+        in artist_list
+    ]
@@ -0,0 +1,116 @@
+"""
+Measurement hooks attached to the app. Everything recorded here goes to the
+in-process METRICS registry, which the app serves at /metrics
+"""
+import contextvars
+import functools
+import json
+import time
+from typing import Callable
+
+import reflex as rx
+from fastapi import HTTPException, Request
+from reflex.event import Event
+from reflex.state import BaseState, StateUpdate
+from reflex.vars import ComputedVar
+
+from .client import SPOTIFY_CLIENTS
+from .constants import STATE_DELTA_WARN_BYTES
+from .devices import ACTIVE_DEVICES_CACHE
+from .genres import ARTIST_GENRE_CACHE
+from .metrics import METRICS
+from .playlists import CURRENT_USER_ID_CACHE
+from .recommendations import RECOMMENDATIONS_CACHE
+from .search import SEARCH_RESULTS_CACHE
+
+# when the event being processed in this context was picked up; background
+# tasks copy it when they are started
+_event_started_at: contextvars.ContextVar[float] = contextvars.ContextVar(
+    'event_started_at'
+)
+
+
+class InstrumentationMiddleware(rx.Middleware):
+    """Time every event, from being picked up to its final state update
+    having been computed, and record the serialized size of a sample of
+    state updates. Background events are timed until their task finishes.
+    Sampled updates over STATE_DELTA_WARN_BYTES are logged along with their
+    largest vars. Deltas pushed from inside a background task's
+    `async with self` block bypass middleware and are not sized
+    """
+    async def preprocess(self, app: rx.App, state: BaseState, event: Event) -> None:
+        _event_started_at.set(time.perf_counter())
+        return None
+
+    async def postprocess(
+            self,
+            app: rx.App,
+            state: BaseState,
+            event: Event,
+            update: StateUpdate,
+        ) -> StateUpdate:
+        METRICS.increment('state.updates')
+        if update.final:
+            started_at = _event_started_at.get(None)
+            if started_at is not None:
+                METRICS.observe(f'event.{event.name}', time.perf_counter() - started_at)
+        if METRICS.sampled():
+            self._record_size(event, update)
+        return update
+
+    @staticmethod
+    def _record_size(event: Event, update: StateUpdate):
+        size = len(update.json())
+        METRICS.increment('state.updates_sized')
+        METRICS.increment('state.update_bytes', size)
+        METRICS.increment(f'state.update_bytes.{event.name}', size)
+
+        if size > STATE_DELTA_WARN_BYTES:
+            var_sizes = sorted(
+                (
+                    (len(json.dumps(value, default=str)), f'{substate}.{var}')
+                    for substate, substate_delta in update.delta.items()
+                    for var, value in substate_delta.items()
+                ),
+                reverse=True
+            )
+            print(
+                f'Large state update for {event.name}: {size} bytes;',
+                ', '.join(f'{name} {var_size}' for var_size, name in var_sizes[:3])
+            )
+
+
+def timed_var(fget: Callable[[BaseState], object]) -> ComputedVar:
+    """rx.var recording how long a sample of its computations take"""
+    name = f'var.{fget.__qualname__}'
+
+    @functools.wraps(fget)
+    def timed_fget(self):
+        if not METRICS.sampled():
+            return fget(self)
+        start = time.perf_counter()
+        try:
+            return fget(self)
+        finally:
+            METRICS.observe(name, time.perf_counter() - start)
+
+    return rx.var(timed_fget)
+
+
+async def metrics_endpoint(request: Request) -> dict:
+    """Dump of the metrics registry, cache statistics and connection reuse,
+    served only to requests from the local machine
+    """
+    if request.client is None or request.client.host not in ('127.0.0.1', '::1'):
+        raise HTTPException(status_code=404)
+    return {
+        **METRICS.snapshot(),
+        'caches': {
+            'artist_genres': ARTIST_GENRE_CACHE.stats(),
+            'search_results': SEARCH_RESULTS_CACHE.stats(),
+            'recommendations': RECOMMENDATIONS_CACHE.stats(),
+            'active_devices': ACTIVE_DEVICES_CACHE.stats(),
+            'current_user_ids': CURRENT_USER_ID_CACHE.stats(),
+        },
+        'connections': SPOTIFY_CLIENTS.connection_stats(),
+    }
@@ -0,0 +1,121 @@
+"""
+Fetching of the user's library from the API. These functions only talk to
+Spotify and build data objects, so they can run off the event loop and
+concurrently with one another
+"""
+from spotipy import Spotify
+
+from .constants import (
+    LIBRARY_BATCH_SIZE,
+    PLAYLIST_ITEMS_PAGE_SIZE,
+    PLAYLISTS_PAGE_SIZE,
+)
+from .data import Playlist, Track
+from .pagination import call_respecting_rate_limit, fetch_all_items, fetch_pages
+from .scheduler import bulk_priority
+from .store import METADATA_STORE
+
+
+def fetch_playlists(sp: Spotify) -> list[Playlist]:
+    """All of the user's playlists, with duplicate names made unique"""
+    print("Fetching playlist info")
+    pl_items = fetch_all_items(
+        sp.current_user_playlists,
+        page_size=PLAYLISTS_PAGE_SIZE
+    )
+    playlists = [Playlist(pl_dict) for pl_dict in pl_items]
+
+    # ensure uniqueness of names
+    playlist_counts = {}
+    for playlist in playlists:
+        name = playlist.playlist_name
+        if name in playlist_counts:
+            playlist_counts[name] += 1
+            playlist.playlist_name = f"{name} ({playlist_counts[name]})"
+        else:
+            playlist_counts[name] = 1
+
+    return playlists
+
+
+def fetch_playlist_tracks(sp: Spotify, playlist_uri: str) -> list[Track]:
+    """Every track of a playlist, skipping removed and local tracks"""
+    playlist_items = fetch_all_items(
+        lambda limit, offset: sp.playlist_items(
+            playlist_uri,
+            limit=limit,
+            offset=offset
+        ),
+        page_size=PLAYLIST_ITEMS_PAGE_SIZE
+    )
+    playlist_tracks = [
+        Track(item)
+        for item in playlist_items
+        if item['track']
+        and 'spotify:local' not in item['track']['uri']
+    ]
+    METADATA_STORE.flush()
+    return playlist_tracks
+
+
+def fetch_recent_tracks(sp: Spotify) -> list[Track]:
+    print('Fetching recent tracks')
+    raw_rp_tracks = call_respecting_rate_limit(
+        sp.current_user_recently_played,
+        limit=LIBRARY_BATCH_SIZE
+    )['items']
+    recent_tracks = [Track(item) for item in raw_rp_tracks]
+    METADATA_STORE.flush()
+    return recent_tracks
+
+
+def fetch_liked_tracks(sp: Spotify, offset: int) -> tuple[list[Track], int]:
+    """One batch of liked tracks starting at offset, and the total number
+    of liked tracks
+    """
+    liked_page = call_respecting_rate_limit(
+        sp.current_user_saved_tracks,
+        limit=LIBRARY_BATCH_SIZE,
+        offset=offset
+    )
+    liked_tracks = [Track(item) for item in liked_page['items']]
+    METADATA_STORE.flush()
+    return liked_tracks, liked_page['total']
+
+
+@bulk_priority()
+def fetch_liked_track_batches(
+        sp: Spotify,
+        offsets: list[int],
+    ) -> tuple[list[Track], int]:
+    """Consecutive batches of liked tracks, one starting at each of offsets,
+    fetched concurrently; also returns the total number of liked tracks
+    """
+    print('Fetching', len(offsets), 'batches of liked tracks')
+    liked_pages = fetch_pages(
+        sp.current_user_saved_tracks,
+        offsets,
+        limit=LIBRARY_BATCH_SIZE
+    )
+    liked_tracks = [
+        Track(item)
+        for page in liked_pages
+        for item in page['items']
+    ]
+    METADATA_STORE.flush()
+    total = liked_pages[-1]['total'] if len(liked_pages) > 0 else 0
+    return liked_tracks, total
+
+
+def fetch_top_tracks(sp: Spotify) -> list[Track]:
+    print('Fetching top tracks')
+    raw_top_tracks = call_respecting_rate_limit(
+        sp.current_user_top_tracks,
+        limit=LIBRARY_BATCH_SIZE
+    )['items']
+    top_tracks = [
+        Track(item, track_enclosed_in_item=False)
+        for item in raw_top_tracks
+    ]
+    METADATA_STORE.flush()
+    return top_tracks
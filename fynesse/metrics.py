@@ -0,0 +1,65 @@
+"""
+Lightweight in-process metrics
+"""
+import os
+import random
+import threading
+from collections import defaultdict
+
+from .constants import METRICS_SAMPLE_RATE
+
+
+class MetricsRegistry:
+    """Named counters and timings shared by every session in the server
+    process. Measurements that are costly to take are only taken for a
+    sample_rate fraction of calls, as decided by sampled()
+    """
+    def __init__(self, sample_rate: float):
+        self.sample_rate = sample_rate
+        self._counters: defaultdict[str, int] = defaultdict(int)
+        # name -> [count, total seconds, max seconds]
+        self._timings: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration under name"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    def sampled(self) -> bool:
+        """Whether to take a sampled measurement this time"""
+        return random.random() < self.sample_rate
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'counters': dict(self._counters),
+                'timings': {
+                    name: {
+                        'count': count,
+                        'total_ms': total * 1000,
+                        'mean_ms': total * 1000 / count,
+                        'max_ms': max_ * 1000,
+                    }
+                    for name, (count, total, max_) in self._timings.items()
+                },
+            }
+
+
+METRICS = MetricsRegistry(
+    sample_rate=float(os.getenv('FYNESSE_METRICS_SAMPLE_RATE', METRICS_SAMPLE_RATE))
+)
@@ -0,0 +1,82 @@
+"""
+Fetching of paginated API results: once the first page reports the total,
+the remaining pages are requested concurrently and merged in order
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from spotipy import SpotifyException
+
+from .constants import PAGINATION_MAX_WORKERS, RATE_LIMIT_MAX_ATTEMPTS
+from .metrics import METRICS
+from .scheduler import submit_in_context
+
+
+def call_respecting_rate_limit(fn: Callable, *args, **kwargs):
+    """Call fn, retrying whenever it is rate limited, up to
+    RATE_LIMIT_MAX_ATTEMPTS attempts; the request scheduler holds each retry
+    back until the Retry-After period is over
+    """
+    for attempt in range(RATE_LIMIT_MAX_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 429 or attempt == RATE_LIMIT_MAX_ATTEMPTS - 1:
+                raise
+            METRICS.increment('api.rate_limit_backoffs')
+
+
+def fetch_pages(
+        fetch_page: Callable[..., dict],
+        offsets: list[int],
+        limit: int,
+    ) -> list[dict]:
+    """Fetch the pages starting at each of offsets concurrently on a
+    bounded thread pool, returning them in offset order
+    """
+    if len(offsets) == 0:
+        return []
+
+    def fetch_offset(offset: int) -> dict:
+        return call_respecting_rate_limit(
+            fetch_page,
+            limit=limit,
+            offset=offset
+        )
+
+    workers = min(PAGINATION_MAX_WORKERS, len(offsets))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            submit_in_context(executor, fetch_offset, offset)
+            for offset in offsets
+        ]
+        return [future.result() for future in futures]
+
+
+def fetch_all_items(
+        fetch_page: Callable[..., dict],
+        page_size: int,
+        max_items: int = None,
+    ) -> list[dict]:
+    """Return the items of every page of a paginated endpoint, in order.
+    fetch_page is called with limit and offset keyword arguments; the first
+    page is fetched alone to learn the total, then the remaining offsets are
+    fetched concurrently on a bounded thread pool
+    """
+    first_page = call_respecting_rate_limit(
+        fetch_page,
+        limit=page_size,
+        offset=0
+    )
+    items = list(first_page['items'])
+
+    limit = first_page.get('limit') or page_size
+    total = first_page.get('total') or len(items)
+    if max_items is not None:
+        total = min(total, max_items)
+
+    offsets = list(range(limit, total, limit))
+    for page in fetch_pages(fetch_page, offsets, limit):
+        items.extend(page['items'])
+
+    return items[:total]
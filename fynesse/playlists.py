@@ -0,0 +1,95 @@
+"""
+Writing of playlists to the API: tracks are added in API-sized chunks, in
+order, retrying chunks that fail transiently
+"""
+import time
+
+import requests
+from spotipy import Spotify, SpotifyException
+
+from .cache import TTLCache
+from .constants import (
+    CURRENT_USER_CACHE_MAX_ENTRIES,
+    CURRENT_USER_CACHE_TTL_SECONDS,
+    PLAYLIST_ADD_ITEMS_CHUNK_SIZE,
+    PLAYLIST_WRITE_MAX_ATTEMPTS,
+    PLAYLIST_WRITE_RETRY_BACKOFF_SECONDS,
+)
+from .pagination import call_respecting_rate_limit
+
+# Spotify user ids, keyed on access token
+CURRENT_USER_ID_CACHE = TTLCache(
+    maxsize=CURRENT_USER_CACHE_MAX_ENTRIES,
+    ttl=CURRENT_USER_CACHE_TTL_SECONDS,
+)
+
+
+def current_user_id(sp: Spotify, access_token: str) -> str:
+    user_id = CURRENT_USER_ID_CACHE.get(access_token)
+    if user_id is None:
+        user_id = call_respecting_rate_limit(sp.current_user)['id']
+        CURRENT_USER_ID_CACHE.set(access_token, user_id)
+    return user_id
+
+
+def create_playlist(sp: Spotify, access_token: str, name: str) -> str:
+    """Create an empty playlist for the user owning access_token, returning
+    its id
+    """
+    return call_respecting_rate_limit(
+        sp.user_playlist_create,
+        user=current_user_id(sp, access_token),
+        name=name
+    )['id']
+
+
+def item_chunks(track_uris: list[str]) -> list[list[str]]:
+    """track_uris split into chunks small enough for one add items call"""
+    return [
+        track_uris[i:i + PLAYLIST_ADD_ITEMS_CHUNK_SIZE]
+        for i in range(0, len(track_uris), PLAYLIST_ADD_ITEMS_CHUNK_SIZE)
+    ]
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, SpotifyException):
+        return e.http_status == 429 or e.http_status >= 500
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def _playlist_length(sp: Spotify, playlist_id: str) -> int:
+    return call_respecting_rate_limit(
+        sp.playlist_items,
+        playlist_id,
+        fields='total',
+        limit=1
+    )['total']
+
+
+def add_items_chunk(
+        sp: Spotify,
+        playlist_id: str,
+        chunk: list[str],
+        position: int,
+    ):
+    """Add one chunk of tracks at position, the current end of the
+    playlist. Transient failures are retried; since a failed call may still
+    have been applied, the playlist's length is checked before each retry
+    so a chunk is never added twice
+    """
+    for attempt in range(PLAYLIST_WRITE_MAX_ATTEMPTS):
+        try:
+            if attempt > 0 and _playlist_length(sp, playlist_id) >= position + len(chunk):
+                return
+            call_respecting_rate_limit(
+                sp.playlist_add_items,
+                playlist_id=playlist_id,
+                items=chunk,
+                position=position
+            )
+            return
+        except Exception as e:
+            if not _is_transient(e) or attempt == PLAYLIST_WRITE_MAX_ATTEMPTS - 1:
+                raise
+            print('Playlist write failed; retrying:', e)
+            time.sleep(PLAYLIST_WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
@@ -0,0 +1,211 @@
+"""
+Fetching of recommendations from the API, backed by a cache of responses
+shared by every session in the server process
+"""
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from spotipy import Spotify
+
+from .cache import TTLCache
+from .constants import (
+    RECOMMENDATION_BATCH_MAX_GROUPS,
+    RECOMMENDATION_BATCH_MAX_WORKERS,
+    RECOMMENDATION_CACHE_MAX_ENTRIES,
+    RECOMMENDATION_MAX_SEEDS,
+    RECOMMENDATION_CACHE_TTL_SECONDS,
+    RECOMMENDATION_TARGET_STEP,
+    RECOMMENDATION_TEMPO_STEP,
+)
+from .data import Track
+from .genres import tracks_with_genres
+from .metrics import METRICS
+from .pagination import call_respecting_rate_limit
+from .scheduler import bulk_priority, submit_in_context
+from .store import METADATA_STORE
+
+# Raw recommended track dicts, keyed on the quantized generation parameters
+RECOMMENDATIONS_CACHE = TTLCache(
+    maxsize=RECOMMENDATION_CACHE_MAX_ENTRIES,
+    ttl=RECOMMENDATION_CACHE_TTL_SECONDS,
+)
+
+# Parameter keys currently being fetched, mapped to a future resolving to
+# their raw tracks; a germinate arriving during a prefetch waits on it
+_in_flight: dict[tuple, Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def _quantize(value: float, step: float) -> float:
+    return round(round(value / step) * step, 6)
+
+
+def quantize_params(generation_params: dict) -> dict:
+    """Copy of generation_params with unset parameters dropped and target
+    values snapped to a grid, so that nearby slider positions share a cache
+    entry
+    """
+    quantized = {}
+    for name, value in generation_params.items():
+        if value is None:
+            continue
+        if name.endswith('tempo'):
+            value = int(_quantize(value, RECOMMENDATION_TEMPO_STEP))
+        elif name.startswith('target_'):
+            value = _quantize(value, RECOMMENDATION_TARGET_STEP)
+        quantized[name] = value
+    return quantized
+
+
+def params_key(generation_params: dict) -> tuple:
+    """Hashable cache key for a set of quantized generation parameters.
+    Seed order does not affect recommendations, so seeds are sorted
+    """
+    return tuple(
+        (name, tuple(sorted(value)) if isinstance(value, list) else value)
+        for name, value in sorted(generation_params.items())
+    )
+
+
+def _recommended_raw_tracks(sp: Spotify, generation_params: dict) -> list[dict]:
+    key = params_key(generation_params)
+    raw_tracks = RECOMMENDATIONS_CACHE.get(key)
+    if raw_tracks is not None:
+        METRICS.increment('recommendations.cache_hits')
+        return raw_tracks
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+    if not owner:
+        METRICS.increment('recommendations.coalesced')
+        return future.result()
+
+    METRICS.increment('recommendations.cache_misses')
+    try:
+        raw_tracks = call_respecting_rate_limit(
+            sp.recommendations,
+            **generation_params
+        )['tracks']
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        RECOMMENDATIONS_CACHE.set(key, raw_tracks)
+        future.set_result(raw_tracks)
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+    return raw_tracks
+
+
+def fetch_recommended_tracks(sp: Spotify, generation_params: dict) -> list[Track]:
+    """Recommended tracks (with their genres) for quantized generation
+    parameters, from the cache if the same parameters were used recently
+    """
+    raw_tracks = _recommended_raw_tracks(sp, generation_params)
+    recc_tracks = [
+        Track(track, track_enclosed_in_item=False)
+        for track
+        in raw_tracks
+    ]
+    METADATA_STORE.flush()
+    return tracks_with_genres(sp, recc_tracks)
+
+
+@bulk_priority()
+def prefetch_recommended_tracks(sp: Spotify, generation_params: dict):
+    """Warm the recommendation and genre caches for generation parameters
+    the user is likely to germinate with next
+    """
+    key = params_key(generation_params)
+    if key in _in_flight or key in RECOMMENDATIONS_CACHE:
+        return
+    METRICS.increment('recommendations.prefetched')
+    try:
+        fetch_recommended_tracks(sp, generation_params)
+    except Exception as e:
+        print('Recommendation prefetch failed:', e)
+
+
+def seed_groups(
+        seed_track_uris: list[str],
+        seed_artist_uris: list[str],
+    ) -> list[dict]:
+    """Split a pool of seeds into groups small enough for one
+    recommendations request each. A pool too large for
+    RECOMMENDATION_BATCH_MAX_GROUPS groups is sampled evenly across its
+    length, so every part of the pool is represented
+    """
+    pool = list(dict.fromkeys(
+        [('seed_tracks', uri) for uri in seed_track_uris]
+        + [('seed_artists', uri) for uri in seed_artist_uris]
+    ))
+    max_seeds = RECOMMENDATION_BATCH_MAX_GROUPS * RECOMMENDATION_MAX_SEEDS
+    if len(pool) > max_seeds:
+        pool = [pool[i * len(pool) // max_seeds] for i in range(max_seeds)]
+
+    groups = []
+    for i in range(0, len(pool), RECOMMENDATION_MAX_SEEDS):
+        group = {'seed_tracks': [], 'seed_artists': []}
+        for seed_type, uri in pool[i:i + RECOMMENDATION_MAX_SEEDS]:
+            group[seed_type].append(uri)
+        groups.append(group)
+    return groups
+
+
+def fetch_batch_recommended_tracks(
+        sp: Spotify,
+        seed_track_uris: list[str],
+        seed_artist_uris: list[str],
+        target_params: dict,
+        limit_per_group: int,
+        max_tracks: int,
+    ) -> list[Track]:
+    """Recommended tracks (with their genres) for a seed pool of any size.
+    The pool is split into seed groups whose requests run concurrently; the
+    results are merged without duplicates or seeds, ranked by how many
+    groups recommended each track and then by first appearance
+    """
+    groups = seed_groups(seed_track_uris, seed_artist_uris)
+    if len(groups) == 0:
+        return []
+    params_list = [
+        quantize_params({**target_params, **group, 'limit': limit_per_group})
+        for group in groups
+    ]
+
+    print('Fetching', len(groups), 'sets of recommended tracks')
+    workers = min(RECOMMENDATION_BATCH_MAX_WORKERS, len(groups))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            submit_in_context(executor, _recommended_raw_tracks, sp, params)
+            for params in params_list
+        ]
+        raw_track_lists = [future.result() for future in futures]
+
+    seed_uris = set(seed_track_uris)
+    counts = Counter()
+    first_seen = {}
+    for raw_tracks in raw_track_lists:
+        for raw_track in raw_tracks:
+            uri = raw_track['uri']
+            if uri in seed_uris:
+                continue
+            counts[uri] += 1
+            first_seen.setdefault(uri, raw_track)
+
+    ranked_uris = sorted(
+        first_seen,
+        key=lambda uri: -counts[uri]
+    )[:max_tracks]
+    recc_tracks = [
+        Track(first_seen[uri], track_enclosed_in_item=False)
+        for uri
+        in ranked_uris
+    ]
+    METADATA_STORE.flush()
+    return tracks_with_genres(sp, recc_tracks)
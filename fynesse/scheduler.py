@@ -0,0 +1,213 @@
+"""
+Scheduling of Spotify API requests. Every call made by a Spotify client
+passes through the shared scheduler, which budgets requests with token
+buckets for the app credential and for each user, holds calls back for the
+Retry-After period once the API rate limits the app, and lets interactive
+calls ahead of bulk ones
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable
+
+from spotipy import SpotifyException
+
+from .cache import TTLCache
+from .constants import (
+    CLIENT_REGISTRY_MAX_CLIENTS,
+    RATE_LIMIT_DEFAULT_BACKOFF_SECONDS,
+    SCHEDULER_APP_BURST,
+    SCHEDULER_APP_RATE_PER_SECOND,
+    SCHEDULER_BULK_RESERVE,
+    SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS,
+    SCHEDULER_USER_BUCKET_TTL_SECONDS,
+    SCHEDULER_USER_BURST,
+    SCHEDULER_USER_RATE_PER_SECOND,
+)
+from .metrics import METRICS
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# priority of the API calls made in this context; calls are interactive
+# unless made inside bulk_priority
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    'request_priority',
+    default=INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def bulk_priority():
+    """Make the API calls issued inside the block, or inside a function
+    decorated with it, at bulk priority
+    """
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority of the API calls made in this context"""
+    return _priority.get()
+
+
+def submit_in_context(executor: Executor, fn: Callable, *args) -> Future:
+    """executor.submit, running fn with the caller's context variables, so
+    its API calls keep the caller's priority
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _on_event_loop_thread() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def retry_after_seconds(exception: SpotifyException) -> float:
+    """Seconds to wait according to a 429 response's Retry-After header"""
+    headers = exception.headers or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return RATE_LIMIT_DEFAULT_BACKOFF_SECONDS
+
+
+class TokenBucket:
+    """Allows rate requests per second in bursts of up to capacity. A
+    request may only draw the bucket down to a floor set by its priority:
+    bulk requests leave SCHEDULER_BULK_RESERVE of a burst for interactive
+    ones, which may in turn borrow up to a further burst
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._floors = {
+            BULK: capacity * SCHEDULER_BULK_RESERVE,
+            INTERACTIVE: -capacity,
+        }
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority: str) -> float:
+        """Take a token, returning 0, or return the seconds until one could
+        be taken at this priority
+        """
+        floor = self._floors[priority]
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return 0.0
+            return (floor + 1 - self._tokens) / self.rate
+
+    def release(self):
+        """Return a token taken for a request that was not sent"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class RequestScheduler:
+    """Admits API requests once both the app's bucket and the user's bucket
+    allow them and no rate limit pause is in effect. Bulk requests wait as
+    long as it takes; interactive requests wait at most
+    SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS, and beyond that fail at once as
+    rate limited rather than holding up their event
+    """
+    def __init__(
+            self,
+            app_rate: float,
+            app_burst: float,
+            user_rate: float,
+            user_burst: float,
+        ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._app_bucket = TokenBucket(app_rate, app_burst)
+        # keyed on access token
+        self._user_buckets = TTLCache(
+            maxsize=CLIENT_REGISTRY_MAX_CLIENTS,
+            ttl=SCHEDULER_USER_BUCKET_TTL_SECONDS,
+        )
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user_key: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._user_buckets.get(user_key)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+                self._user_buckets.set(user_key, bucket)
+            return bucket
+
+    def _try_acquire(self, user_bucket: TokenBucket, priority: str) -> float:
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            return delay
+        delay = user_bucket.try_acquire(priority)
+        if delay > 0:
+            return delay
+        delay = self._app_bucket.try_acquire(priority)
+        if delay > 0:
+            user_bucket.release()
+        return delay
+
+    def acquire(self, user_key: str):
+        """Block until a request for the user may be sent. Refuses to block
+        the event loop's thread, where waiting would stall every session:
+        event handlers send their requests with asyncio.to_thread
+        """
+        if _on_event_loop_thread():
+            raise RuntimeError('Spotify request sent from the event loop thread')
+        priority = current_priority()
+        user_bucket = self._user_bucket(user_key)
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(user_bucket, priority)
+            if delay <= 0:
+                break
+            if priority == INTERACTIVE\
+                    and waited + delay > SCHEDULER_INTERACTIVE_MAX_WAIT_SECONDS:
+                METRICS.increment('scheduler.rejected')
+                raise SpotifyException(
+                    429,
+                    -1,
+                    'Rate limited; request not sent',
+                    headers={'Retry-After': str(delay)},
+                )
+            time.sleep(delay)
+            waited += delay
+        if waited > 0:
+            METRICS.observe(f'scheduler.wait.{priority}', waited)
+
+    def pause(self, seconds: float):
+        """Hold every request back for seconds, after a rate limited
+        response
+        """
+        METRICS.increment('scheduler.pauses')
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+SCHEDULER = RequestScheduler(
+    app_rate=float(os.getenv('FYNESSE_API_RATE_PER_SECOND', SCHEDULER_APP_RATE_PER_SECOND)),
+    app_burst=SCHEDULER_APP_BURST,
+    user_rate=SCHEDULER_USER_RATE_PER_SECOND,
+    user_burst=SCHEDULER_USER_BURST,
+)
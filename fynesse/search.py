@@ -0,0 +1,80 @@
+"""
+Fetching of search results from the API
+"""
+from spotipy import Spotify
+
+from .cache import TTLCache
+from .constants import (
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_RESULTS_TYPE_ARTISTS,
+    SEARCH_RESULTS_TYPE_TRACKS,
+)
+from .data import Artist, Track
+from .genres import artists_with_genres
+from .pagination import call_respecting_rate_limit
+
+# Raw result pages, shared by every session, keyed on
+# (normalized query, result type, limit, offset)
+SEARCH_RESULTS_CACHE = TTLCache(
+    maxsize=SEARCH_CACHE_MAX_ENTRIES,
+    ttl=SEARCH_CACHE_TTL_SECONDS,
+)
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.lower().split())
+
+
+def _search_page(
+        sp: Spotify,
+        query: str,
+        api_type: str,
+        limit: int,
+        offset: int,
+    ) -> dict:
+    """One page of raw search results, from the cache if it holds a recent
+    copy of the same page
+    """
+    key = (normalize_query(query), api_type, limit, offset)
+    page = SEARCH_RESULTS_CACHE.get(key)
+    if page is None:
+        page = call_respecting_rate_limit(
+            sp.search,
+            q=query,
+            type=api_type,
+            limit=limit,
+            offset=offset
+        )[api_type + 's']
+        SEARCH_RESULTS_CACHE.set(key, page)
+    return page
+
+
+def fetch_search_results(
+        sp: Spotify,
+        query: str,
+        results_type: str,
+        limit: int,
+        offset: int,
+    ) -> tuple[list[Track] | list[Artist], bool]:
+    """One page of tracks or artists (with their genres) matching query,
+    and whether more results exist beyond it
+    """
+    if results_type == SEARCH_RESULTS_TYPE_TRACKS:
+        raw_tracks = _search_page(sp, query, 'track', limit, offset)
+        results = [
+            Track(item, track_enclosed_in_item=False)
+            for item
+            in raw_tracks['items']
+        ]
+        return results, bool(raw_tracks['next'])
+
+    elif results_type == SEARCH_RESULTS_TYPE_ARTISTS:
+        raw_artists = _search_page(sp, query, 'artist', limit, offset)
+        results = artists_with_genres(
+            sp,
+            [Artist(item) for item in raw_artists['items']]
+        )
+        return results, bool(raw_artists['next'])
+
+    return [], False
@@ -0,0 +1,40 @@
+"""
+Coalescing of identical concurrent calls
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time. Callers arriving while a
+    call with their key is in flight wait for it and share its result, or
+    its exception, instead of making the call again
+    """
+    def __init__(self):
+        self._in_flight: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], object]) -> tuple[object, bool]:
+        """Result of fn, and whether it was shared from another caller's
+        call; a shared result must not be modified
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return result, False
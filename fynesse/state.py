@@ -1,20 +1,26 @@
 """
 State classes
 """
+import asyncio
 import os
+import time
 
 import reflex as rx
-from spotipy import Spotify
+from spotipy import Spotify, SpotifyException
+from .auth import TOKEN_MANAGER, parse_token_json
+from .client import SPOTIFY_CLIENTS
 from .data import *
+from .devices import cached_active_devices, fetch_active_devices
+from .genres import tracks_with_genres
+from .instrumentation import timed_var
+from .metrics import METRICS
+from .scheduler import bulk_priority
+from . import library, playlists, recommendations, search, sync
 from .utilities import *
 from .constants import *
-from icecream import ic
-import json
 import random
 import string
 import urllib
-import base64
-import requests
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -23,7 +29,7 @@ class State(rx.State):
     contains logic around authentication, track data, recommendations, and playback
     """
     
-    @rx.var
+    @timed_var
     def callback_code_and_state(self) -> tuple[str]:
         """Code and state from callback uri after redirect"""
         args = self.router.page.params
@@ -37,7 +43,7 @@ class State(rx.State):
         ) for i in range(16)
     )
 
-    @rx.var
+    @timed_var
     def spotify_auth_url(self) -> str:
         """Url to take user to Spotify authentication page"""
         scope = ' '.join(SPOTIFY_API_SCOPES)
@@ -55,91 +61,85 @@ class State(rx.State):
     
     auth_token_json: str = rx.LocalStorage('', name='auth_token')
 
-    def get_auth_token_from_callback(self):
+    @rx.background
+    async def get_auth_token_from_callback(self):
         """Request an authentication token from Spotify based on the code
-        provided in the redirect. If the state string provided in tbe redirect
-        does not match that provided for the authentication url, do not accept
-        it. Update state var with provided auth token
+        provided in the redirect, off the event loop. If the state string
+        provided in tbe redirect does not match that provided for the
+        authentication url, do not accept it. Update state var with provided
+        auth token, then load the session
         """
-        print('Getting spotify authentication token')
-        code, state = self.callback_code_and_state
-        if state == self.code_req_state:
-            auth_options = {
-                'url': 'https://accounts.spotify.com/api/token',
-                'data': {
-                    'code': code,
-                    'redirect_uri': os.getenv('SPOTIFY_REDIRECT_URI'),
-                    'grant_type': 'authorization_code'
-                },
-                'headers': {
-                    'content-type': 'application/x-www-form-urlencoded',
-                    'Authorization': 'Basic ' + base64.b64encode((
-                        os.getenv('SPOTIFY_CLIENT_ID') + ':' + os.getenv("SPOTIFY_CLIENT_SECRET")
-                    ).encode()).decode('utf-8')
-                }
-            }
-            
-            response = requests.post(
-                auth_options['url'],
-                data=auth_options['data'],
-                headers=auth_options['headers']
-            )
-
-            enriched_response_dict = add_token_expiry_time(response.json())
-            self.auth_token_json = json.dumps(enriched_response_dict)
-
-
-    def _refresh_auth_token(self):
-        """Use authentication token's 'refresh_token' property to request a new
-        spotify authenticatioun token; update the state var accordingly
-        """
-        print('Refreshing Spotify authentication token')
-        refresh_token = json.loads(self.auth_token_json)['refresh_token']
-        auth_options = {
-                'url': 'https://accounts.spotify.com/api/token',
-                'data': {
-                    'refresh_token': refresh_token,
-                    'grant_type': 'refresh_token'
-                },
-                'headers': {
-                    'content-type': 'application/x-www-form-urlencoded',
-                    'Authorization': 'Basic ' + base64.b64encode((
-                        os.getenv("SPOTIFY_CLIENT_ID") + ':' + os.getenv("SPOTIFY_CLIENT_SECRET")
-                    ).encode()).decode('utf-8')
-                }
-            }
-            
-        response = requests.post(
-            auth_options['url'],
-            data=auth_options['data'],
-            headers=auth_options['headers']
+        async with self:
+            code, state = self.callback_code_and_state
+            if state != self.code_req_state:
+                return
+        token_json = await asyncio.to_thread(
+            TOKEN_MANAGER.exchange_code,
+            code,
+            os.getenv('SPOTIFY_REDIRECT_URI')
         )
+        async with self:
+            self.auth_token_json = token_json
+        return [
+            State.initial_library_fetch,
+            State.poll_active_devices,
+            State.sync_library,
+        ]
 
-        enriched_response_dict = {
-            **add_token_expiry_time(response.json()),
-            'refresh_token': refresh_token
-        }
-        self.auth_token_json = json.dumps(enriched_response_dict)
+    def _sync_auth_token(self):
+        """Replace the session's token snapshot with the newest token, which
+        another event or session may already have refreshed. Never refreshes
+        it, which would block the event loop; see _renew_auth_token
+        """
+        token_json = TOKEN_MANAGER.latest_token_json(self.auth_token_json)
+        if token_json != self.auth_token_json:
+            self.auth_token_json = token_json
+
+    async def _renew_auth_token(self):
+        """Refresh the session's token off the event loop if it is about to
+        expire. Background handlers await this before taking the state lock
+        to call get_sp, which then picks the renewed token up
+        """
+        auth_token_json = self.auth_token_json
+        if len(auth_token_json) > 0:
+            await asyncio.to_thread(TOKEN_MANAGER.current_token_json, auth_token_json)
 
-    @rx.var
+    @timed_var
     def app_is_authenticated(self) -> bool:
         return len(self.auth_token_json) > 0
     
     def get_sp(self) -> Spotify:
-        """Get a spotify instance"""
+        """Get the pooled spotify client for the newest known access token"""
         if self.app_is_authenticated:
-            return Spotify(auth=json.loads(self.auth_token_json)['access_token'])
+            self._sync_auth_token()
+            return SPOTIFY_CLIENTS.get(
+                parse_token_json(self.auth_token_json)['access_token']
+            )
 
     library_fetched: bool = False
 
-    playlist_tracks: dict[str, list[Track]] = {
-        '': []
-    }
-    recent_tracks: list[Track] = []
-    liked_tracks: list[Track] = []
-    top_tracks: list[Track] = []
+    # contents of recently opened playlists; only the selected playlist's
+    # tracks are sent to the client
+    _playlist_tracks: PlaylistTrackStore = PlaylistTrackStore(
+        maxsize=PLAYLIST_TRACKS_MAX_PLAYLISTS
+    )
+    # full library lists stay on the server; the client is sent a window
+    _recent_tracks: TrackList = TrackList()
+    _liked_tracks: TrackList = TrackList()
+    _top_tracks: TrackList = TrackList()
+    recent_window: TrackWindow = TrackWindow()
+    liked_window: TrackWindow = TrackWindow()
+    top_window: TrackWindow = TrackWindow()
+    playlist_window: TrackWindow = TrackWindow()
+    liked_tracks_total: int = 0
+    liked_tracks_loading: bool = False
+    # user id under which liked songs are read from the metadata store; ''
+    # until they are stored and up to date
+    _liked_user_id: str = ''
     search_tracks: list[Track] = []
-    search_tracks_including_prev: list[Track] = []
+    _track_registry: TrackRegistry = TrackRegistry()
+    # uris of the most recent search results, oldest first
+    _search_history: list[str] = []
 
     recc_tracks: list[Track] = []
     playlists: list[Playlist]
@@ -151,7 +151,6 @@ class State(rx.State):
     seed_genres: list[str]
     seed_artists_uris_names: list[list[str]]
     selected_playlist: Playlist = Playlist()
-    _genre_lookup: dict[str, str] = dict()
 
     ### RECOMMENDATION PARAMETERS
     recc_target_acousticness_value: float = 0
@@ -227,206 +226,480 @@ class State(rx.State):
     num_recommendations: int = NUM_RECCOMENDATIONS_DEFAULT
     
     #### LIBRARY FROM API
-    def fetch_playlists(self):
-        print("Fetching playlist info")
-
-        pl_results = self.get_sp().current_user_playlists()
-        pl_items = pl_results['items']
-        while pl_results['next']:
-            pl_results = self.get_sp().next(pl_results)
-            pl_items.extend(pl_results['items'])
-
-        self.playlists = [Playlist(pl_dict) for pl_dict in pl_items]
-
-        # ensure uniqueness of names
-        playlist_counts = {}
-        for playlist in self.playlists:
-            name = playlist.playlist_name
-            if name in playlist_counts:
-                playlist_counts[name] += 1
-                playlist.playlist_name = f"{name} ({playlist_counts[name]})"
-            else:
-                playlist_counts[name] = 1        
-
-    def fetch_tracks_for_playlist(self, playlist: Playlist):
-        print("Fetching playlist tracks for PL", playlist.playlist_name)
-
-        pl_results = self.get_sp().playlist_items(playlist.uri)
-        playlist_tracks = pl_results['items']
-        while pl_results['next']:
-            pl_results = self.get_sp().next(pl_results)
-            playlist_tracks.extend(pl_results['items'])
-        
-        self.playlist_tracks[playlist.playlist_name] = [
-            Track(item)
-            for item in playlist_tracks
-            if item['track']
-            and 'spotify:local' not in item['track']['uri']
-        ]
-
-    def fetch_recent_tracks(self):
-        print('Fetching recent tracks')
-        raw_rp_tracks = self.get_sp().current_user_recently_played(
-            limit=50
-        )['items']
-        self.recent_tracks = [
-            Track(item)
-            for item
-            in raw_rp_tracks
-        ]
-        self.top_tracks_have_genre = False
-    
-    def fetch_liked_tracks_batch(self):
-        print('Fetching a batch of liked tracks')
-        raw_liked_tracks = self.get_sp().current_user_saved_tracks(
-            limit=50,
-            offset=len(self.liked_tracks)
-        )['items']
-        self.liked_tracks = self.liked_tracks + [Track(item) for item in raw_liked_tracks]
-        
-        self.liked_tracks_have_genre = False
-
-    def fetch_top_tracks(self):
-        print('Fetching top tracks')
-        raw_top_tracks = self.get_sp().current_user_top_tracks(limit=50)['items']
-
-        self.top_tracks = [
-            Track(item, track_enclosed_in_item=False)
-            for item
-            in raw_top_tracks
-        ]
-        self.top_tracks_have_genre = False
-
-    def _updated_genre_dict_from_artist_uris(
-        self,
-        a_uris: list[str],
-        existing_genre_lookup: dict[str, list], 
-    ) -> dict[str, list]:
-        """Return an updated dictionary mapping artist uris to lists of genres.
-        Find which artist uris are not already in genre dict, query API for
-        their genres, add the new artists to the genre dict and return it
+    def _register_tracks(self, tracks: list[Track]) -> list[Track]:
+        """Add tracks to the session's registry, returning the registered
+        instances to be stored in a library view
         """
-        artists = []
-        chunk_size = 50
-        a_uris_subset = list(
-            set(a_uris)
-                .difference(
-                    set(existing_genre_lookup.keys())
-                )
-        )
-
-        for i in range(0, len(a_uris_subset), chunk_size):
-            print('Fetching batch of artist genres')
-            chunk = a_uris_subset[i:i + chunk_size] 
-            output_chunk = self.get_sp().artists(chunk)
-            artists.extend(output_chunk['artists'])
+        return self._track_registry.register(tracks)
 
-        genre_lookup_lists = [
-            {a['uri']:a['genres']} for a in
-            artists
+    def _referenced_track_uris(self) -> set[str]:
+        """Uris of every track the session still needs: those in a library
+        view, in recent search or recommendation results, or planted as
+        seeds
+        """
+        views = [
+            self._liked_tracks,
+            self._recent_tracks,
+            self._top_tracks,
+            self.search_tracks,
+            self.recc_tracks,
+            *self._playlist_tracks.values(),
         ]
-
-        new_genre_lookup = {
-            k: v
-            for d
-            in genre_lookup_lists
-            for k, v
-            in d.items()
+        return {
+            *(t.uri for view in views for t in view),
+            *self._search_history,
+            *self.seed_track_uris,
         }
-        expanded_genre_lookup = new_genre_lookup | existing_genre_lookup
 
-        return expanded_genre_lookup
-
-    def _fetch_genres_for_track_list(
-            self,
-            track_list: list[Track]
-        ) -> list[Track]:
-        artist_uris = flatten_list_of_lists(
-            [
-                t.artist_uris
-                for t in track_list
-            ]
-        )
-        self._genre_lookup = self._updated_genre_dict_from_artist_uris(
-            artist_uris,
-            self._genre_lookup,
+    def _evict_unreferenced_tracks(self, uris: list[str]):
+        """Drop whichever of uris are no longer needed from the registry"""
+        referenced = self._referenced_track_uris()
+        self._track_registry.discard(
+            [uri for uri in uris if uri not in referenced]
         )
 
-        return [
-            track.with_artist_genres(
-                flat_genre_list_for_artist_uris(
-                    track.artist_uris,
-                    self._genre_lookup
-                )
-            )
-            for track
-            in track_list
+    def _remember_search_tracks(self, tracks: list[Track]):
+        """Add tracks to the bounded window of recent search results,
+        evicting tracks that fall out of it if nothing else needs them
+        """
+        new_uris = [t.uri for t in tracks]
+        new_uri_set = set(new_uris)
+        history = [
+            uri for uri in self._search_history
+            if uri not in new_uri_set
+        ] + new_uris
+        evicted = history[:-SEARCH_HISTORY_MAX_TRACKS]
+        self._search_history = history[-SEARCH_HISTORY_MAX_TRACKS:]
+        if len(evicted) > 0:
+            self._evict_unreferenced_tracks(evicted)
+
+    @rx.background
+    async def fetch_playlists(self):
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+        playlists = await asyncio.to_thread(library.fetch_playlists, sp)
+        async with self:
+            self.playlists = playlists
+
+    def _store_playlist_tracks(self, playlist_uri: str, tracks: list[Track]):
+        """Keep a playlist's tracks on the server, showing them if it is the
+        selected playlist. Cold playlists evicted to make room lose their
+        genre flag, and their tracks leave the registry if unreferenced
+        """
+        replaced = self._playlist_tracks.get(playlist_uri) or []
+        tracks = self._register_tracks(tracks)
+        evicted = self._playlist_tracks.set(playlist_uri, tracks)
+        if playlist_uri == self.selected_playlist.uri:
+            self._show_track_window('playlist', 0)
+        if len(replaced) > 0:
+            self._evict_unreferenced_tracks([t.uri for t in replaced])
+
+        if len(evicted) > 0:
+            self.playlists = [
+                pl.copy(update={'has_genres': False})
+                if pl.uri in evicted else pl
+                for pl
+                in self.playlists
+            ]
+            self._evict_unreferenced_tracks([
+                t.uri for tracks in evicted.values() for t in tracks
+            ])
+
+    async def _fetch_tracks_for_playlist(self, playlist: Playlist):
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+        tracks = await asyncio.to_thread(sync.playlist_tracks, sp, playlist)
+        async with self:
+            self._store_playlist_tracks(playlist.uri, tracks)
+
+    def _update_playlists(self, new_playlists: list[Playlist]):
+        """Replace the playlist list with a newer sweep of it. Playlists
+        whose snapshot_id is unchanged keep their genre flag
+        """
+        current = {p.uri: p for p in self.playlists}
+        self.playlists = [
+            pl.copy(update={'has_genres': True})
+            if pl.uri in current
+            and current[pl.uri].snapshot_id == pl.snapshot_id
+            and current[pl.uri].has_genres
+            else pl
+            for pl in new_playlists
         ]
+        for pl in self.playlists:
+            if pl.uri == self.selected_playlist.uri:
+                self.selected_playlist = pl
+
+    _library_sync_running: bool = False
+
+    @rx.background
+    async def sync_library(self):
+        """Keep the library current, at bulk priority. Liked songs are
+        synced at once, and fetched in full if they are not stored yet.
+        Then every LIBRARY_SYNC_INTERVAL_SECONDS the playlist list is swept,
+        playlists changed since their contents were stored are fetched
+        again, and liked songs are synced; lists the session has loaded are
+        updated in place. Only one sync runs per session; like the device
+        poller, it stops when the session logs out or goes idle, and is
+        started again by the session's next event
+        """
+        async with self:
+            if self._library_sync_running:
+                return
+            self._library_sync_running = True
+            self._keep_session_tasks_alive()
+
+        try:
+            sweep_playlists = False
+            while True:
+                await self._renew_auth_token()
+                async with self:
+                    if not self.app_is_authenticated\
+                            or time.time() > self._session_idle_deadline:
+                        break
+                    sp = self.get_sp()
+                    access_token = parse_token_json(self.auth_token_json)['access_token']
+
+                try:
+                    with bulk_priority():
+                        if sweep_playlists:
+                            await self._sync_playlists(sp)
+                        await self._sync_liked_tracks(sp, access_token)
+                except Exception as e:
+                    print('Library sync failed:', e)
+                sweep_playlists = True
+                await asyncio.sleep(LIBRARY_SYNC_INTERVAL_SECONDS)
+        finally:
+            async with self:
+                self._library_sync_running = False
+
+    async def _sync_playlists(self, sp: Spotify):
+        new_playlists = await asyncio.to_thread(library.fetch_playlists, sp)
+        async with self:
+            self._update_playlists(new_playlists)
+
+        changed = await asyncio.to_thread(sync.changed_playlists, new_playlists)
+        for playlist in changed:
+            tracks = await asyncio.to_thread(sync.refresh_playlist_tracks, sp, playlist)
+            async with self:
+                if playlist.uri in self._playlist_tracks:
+                    self._store_playlist_tracks(playlist.uri, tracks)
+
+    async def _sync_liked_tracks(self, sp: Spotify, access_token: str):
+        user_id = await asyncio.to_thread(sync.sync_liked_tracks, sp, access_token)
+        if not user_id:
+            user_id = await asyncio.to_thread(
+                sync.refetch_liked_tracks,
+                sp,
+                access_token
+            )
 
-    def _track_list_with_genres(self, track_list: list[Track]) -> list[Track]:
-        track_list = self._fetch_genres_for_track_list(
-            track_list
+        async with self:
+            loaded_count = max(len(self._liked_tracks), LIBRARY_BATCH_SIZE)
+        liked_tracks, total = await asyncio.to_thread(
+            sync.liked_tracks_range,
+            sp,
+            user_id,
+            0,
+            loaded_count
         )
-        return track_list
-
-    def fetch_genres_recent_tracks(self):
-        self.recent_tracks = self._track_list_with_genres(self.recent_tracks)
-        self.recent_tracks_have_genre = True
-
-    def fetch_genres_liked(self):
-        self.liked_tracks = self._track_list_with_genres(self.liked_tracks)
-        self.liked_tracks_have_genre = True
+        async with self:
+            self._liked_user_id = user_id
+            previous_uris = [t.uri for t in self._liked_tracks]
+            if [t.uri for t in liked_tracks] == previous_uris\
+                    and total == self.liked_tracks_total:
+                return
+            self._liked_tracks = TrackList(self._register_tracks(liked_tracks))
+            self.liked_tracks_total = total
+            self.liked_tracks_have_genre = False
+            self._show_track_window('liked', self.liked_window.offset)
+            self._evict_unreferenced_tracks(previous_uris)
+
+    def _full_track_list(self, list_name: str) -> TrackList:
+        if list_name == 'playlist':
+            return TrackList(
+                self._playlist_tracks.get(self.selected_playlist.uri)
+            )
+        return getattr(self, f'_{list_name}_tracks')
 
-    def fetch_genres_top_tracks(self):
-        self.top_tracks = self._track_list_with_genres(self.top_tracks)
-        self.top_tracks_have_genre = True
+    def _show_track_window(self, list_name: str, offset: int):
+        """Send the client the window of a library list starting at offset"""
+        setattr(
+            self,
+            f'{list_name}_window',
+            self._full_track_list(list_name).window(offset, TRACK_LIST_WINDOW_SIZE)
+        )
 
+    def page_track_window(self, list_name: str, direction: int):
+        """Move a library list's window one page forward (direction 1) or
+        back (direction -1)
+        """
+        if list_name not in TRACK_LIST_NAMES:
+            raise ValueError(f'Unknown track list: {list_name}')
+        window = getattr(self, f'{list_name}_window')
+        self._show_track_window(
+            list_name,
+            window.offset + direction * TRACK_LIST_WINDOW_SIZE
+        )
 
-    def fetch_genres_selected_pl(self):
-        self.playlist_tracks[self.selected_playlist.playlist_name] =\
-            self._track_list_with_genres(
-                self.playlist_tracks[self.selected_playlist.playlist_name]
-            )
-        self.selected_playlist = self.selected_playlist.with_genre_flag_true()
-        self.playlists = [
-            pl if pl.playlist_name != self.selected_playlist.playlist_name else pl.with_genre_flag_true()
-            for pl
-            in self.playlists
-        ]
+    @rx.background
+    async def fetch_recent_tracks(self):
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+        recent_tracks = await asyncio.to_thread(library.fetch_recent_tracks, sp)
+        async with self:
+            self._recent_tracks = TrackList(self._register_tracks(recent_tracks))
+            self._show_track_window('recent', 0)
+            self.recent_tracks_have_genre = False
+    
+    @rx.background
+    async def fetch_liked_tracks_batch(self):
+        """Append the next batch of liked tracks and show the page it
+        starts on
+        """
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+            user_id = self._liked_user_id
+            offset = len(self._liked_tracks)
+
+        new_tracks, total = await asyncio.to_thread(
+            sync.liked_tracks_range,
+            sp,
+            user_id,
+            offset,
+            LIBRARY_BATCH_SIZE
+        )
+        async with self:
+            with_genres = self.liked_tracks_have_genre
+        if with_genres:
+            new_tracks = await asyncio.to_thread(tracks_with_genres, sp, new_tracks)
+
+        async with self:
+            if len(self._liked_tracks) != offset:
+                return
+            self._liked_tracks.extend(self._register_tracks(new_tracks))
+            self.liked_tracks_total = total
+            self._show_track_window('liked', offset)
+
+    @rx.background
+    async def load_all_liked_tracks(self):
+        """Append every remaining liked track, a few batches at a time,
+        pushing each step to the client so progress can be shown
+        """
+        await self._renew_auth_token()
+        async with self:
+            if self.liked_tracks_loading:
+                return
+            self.liked_tracks_loading = True
+            sp = self.get_sp()
+            user_id = self._liked_user_id
+            offset = len(self._liked_tracks)
+            total = self.liked_tracks_total
+
+        try:
+            while offset < total:
+                step_end = min(total, offset + LIKED_TRACKS_LOAD_ALL_STEP)
+                with bulk_priority():
+                    new_tracks, total = await asyncio.to_thread(
+                        sync.liked_tracks_range,
+                        sp,
+                        user_id,
+                        offset,
+                        step_end - offset
+                    )
+                async with self:
+                    with_genres = self.liked_tracks_have_genre
+                if with_genres:
+                    with bulk_priority():
+                        new_tracks = await asyncio.to_thread(
+                            tracks_with_genres,
+                            sp,
+                            new_tracks
+                        )
+
+                async with self:
+                    if len(self._liked_tracks) != offset:
+                        break
+                    self._liked_tracks.extend(self._register_tracks(new_tracks))
+                    self.liked_tracks_total = total
+                    self._show_track_window('liked', self.liked_window.offset)
+                offset += len(new_tracks)
+                if len(new_tracks) == 0:
+                    break
+        finally:
+            async with self:
+                self.liked_tracks_loading = False
+
+    @timed_var
+    def all_liked_tracks_loaded(self) -> bool:
+        return self.liked_window.total >= self.liked_tracks_total
+
+    @timed_var
+    def liked_tracks_progress(self) -> int:
+        """Percentage of liked tracks loaded"""
+        if self.liked_tracks_total == 0:
+            return 100
+        return int(100 * self.liked_window.total / self.liked_tracks_total)
+
+    @rx.background
+    async def fetch_top_tracks(self):
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+        top_tracks = await asyncio.to_thread(library.fetch_top_tracks, sp)
+        async with self:
+            self._top_tracks = TrackList(self._register_tracks(top_tracks))
+            self._show_track_window('top', 0)
+            self.top_tracks_have_genre = False
+
+    async def _fetch_genres_for_library_list(self, list_name: str):
+        """Give every track of a library list its genres, fetched off the
+        event loop at bulk priority; the tracks are updated in place, so
+        only the window needs sending again
+        """
+        await self._renew_auth_token()
+        async with self:
+            sp = self.get_sp()
+            tracks = list(self._full_track_list(list_name).tracks)
+        with bulk_priority():
+            await asyncio.to_thread(tracks_with_genres, sp, tracks)
+        async with self:
+            window = getattr(self, f'{list_name}_window')
+            self._show_track_window(list_name, window.offset)
+
+    @rx.background
+    async def fetch_genres_recent_tracks(self):
+        await self._fetch_genres_for_library_list('recent')
+        async with self:
+            self.recent_tracks_have_genre = True
+
+    @rx.background
+    async def fetch_genres_liked(self):
+        # set first, so batches arriving meanwhile are given genres as they
+        # arrive
+        async with self:
+            self.liked_tracks_have_genre = True
+        await self._fetch_genres_for_library_list('liked')
+
+    @rx.background
+    async def fetch_genres_top_tracks(self):
+        await self._fetch_genres_for_library_list('top')
+        async with self:
+            self.top_tracks_have_genre = True
+
+    @rx.background
+    async def fetch_genres_selected_pl(self):
+        async with self:
+            playlist_uri = self.selected_playlist.uri
+        await self._fetch_genres_for_library_list('playlist')
+        async with self:
+            if self.selected_playlist.uri == playlist_uri:
+                self.selected_playlist = self.selected_playlist.with_genre_flag_true()
+            self.playlists = [
+                pl if pl.uri != playlist_uri else pl.with_genre_flag_true()
+                for pl
+                in self.playlists
+            ]
 
-    def initial_library_fetch(self):
-        if not self.library_fetched:
-            self.fetch_recent_tracks()
-            self.fetch_liked_tracks_batch()
-            self.fetch_playlists()
-            self.selected_playlist = self.playlists[0]
-            self.fetch_tracks_for_playlist(self.selected_playlist)
-            self.fetch_top_tracks()
+    @rx.background
+    async def initial_library_fetch(self):
+        """Fetch every library tab concurrently. Each tab is filled in and
+        sent to the client as soon as its own data arrives, so first paint
+        waits only for the slowest single fetch
+        """
+        await self._renew_auth_token()
+        async with self:
+            if self.library_fetched or not self.app_is_authenticated:
+                return
             self.library_fetched = True
+            sp = self.get_sp()
+            access_token = parse_token_json(self.auth_token_json)['access_token']
+
+        async def load_recent():
+            recent_tracks = await asyncio.to_thread(library.fetch_recent_tracks, sp)
+            async with self:
+                self._recent_tracks = TrackList(self._register_tracks(recent_tracks))
+                self._show_track_window('recent', 0)
+                self.recent_tracks_have_genre = False
+
+        async def load_liked():
+            user_id = await asyncio.to_thread(sync.sync_liked_tracks, sp, access_token)
+            liked_tracks, liked_tracks_total = await asyncio.to_thread(
+                sync.liked_tracks_range,
+                sp,
+                user_id,
+                0,
+                LIBRARY_BATCH_SIZE
+            )
+            async with self:
+                self._liked_user_id = user_id
+                self._liked_tracks = TrackList(self._register_tracks(liked_tracks))
+                self.liked_tracks_total = liked_tracks_total
+                self._show_track_window('liked', 0)
+                self.liked_tracks_have_genre = False
+
+        async def load_top():
+            top_tracks = await asyncio.to_thread(library.fetch_top_tracks, sp)
+            async with self:
+                self._top_tracks = TrackList(self._register_tracks(top_tracks))
+                self._show_track_window('top', 0)
+                self.top_tracks_have_genre = False
+
+        async def load_playlists():
+            playlists = await asyncio.to_thread(library.fetch_playlists, sp)
+            async with self:
+                self.playlists = playlists
+                if len(playlists) == 0:
+                    return
+                self.selected_playlist = playlists[0]
+
+            first_playlist_tracks = await asyncio.to_thread(
+                sync.playlist_tracks,
+                sp,
+                playlists[0]
+            )
+            async with self:
+                self._store_playlist_tracks(
+                    playlists[0].uri,
+                    first_playlist_tracks
+                )
 
+        results = await asyncio.gather(
+            load_recent(),
+            load_liked(),
+            load_playlists(),
+            load_top(),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if len(failures) > 0:
+            print('Library fetch failed:', *failures)
+            async with self:
+                self.library_fetched = False
 
     def on_load(self):
         if not self.app_is_authenticated:
             if self.callback_code_and_state != (None, None):
-                self.get_auth_token_from_callback()
-                self.initial_library_fetch()
+                return State.get_auth_token_from_callback
 
         else:
-            if token_expired(json.loads(self.auth_token_json)):
-                self._refresh_auth_token()
+            self._sync_auth_token()
 
-            self.initial_library_fetch()
+            return [
+                State.initial_library_fetch,
+                State.poll_active_devices,
+                State.sync_library,
+            ]
 
     ### RECOMMENDATIONS FROM API
-    def fetch_recommendations(
-            self,
-        ):
-        print(f'Fetching recommended tracks')
-        
-        generation_params_dict = {
-            'seed_artists': self.seed_artist_uris,
-            'seed_tracks': self.seed_track_uris,
-            'limit': self.num_recommendations,
+    _recc_prefetch_generation: int = 0
+
+    def _target_params_dict(self) -> dict:
+        """Recommendation targets set by the enabled parameter controls"""
+        return {
             'target_acousticness': self.recc_target_acousticness_value \
                 if self.recc_target_acousticness_enabled else None,
             'target_energy': self.recc_target_energy_value \
@@ -446,31 +719,146 @@ class State(rx.State):
             'max_tempo': self.recc_max_tempo_value \
                 if self.recc_tempo_range_enabled else None,
         }
-        
-        ic(
+
+    def _generation_params_dict(self, with_targets: bool = True) -> dict:
+        """Quantized parameters for a recommendations request with the
+        current seeds; with_targets=False leaves every target at its default
+        """
+        generation_params_dict = {
+            'seed_artists': self.seed_artist_uris,
+            'seed_tracks': self.seed_track_uris,
+            'limit': self.num_recommendations,
+        }
+        if with_targets:
+            generation_params_dict.update(self._target_params_dict())
+        return recommendations.quantize_params(generation_params_dict)
+
+    @rx.background
+    async def fetch_recommendations(
+            self,
+        ):
+        await self._renew_auth_token()
+        async with self:
+            # without seeds there is nothing to ask for; keep the current
+            # recommendations
+            if self.too_few_seeds:
+                return
+            sp = self.get_sp()
+            generation_params_dict = self._generation_params_dict()
+
+        recc_tracks = await asyncio.to_thread(
+            recommendations.fetch_recommended_tracks,
+            sp,
             generation_params_dict
         )
-        raw_recc_tracks = self.get_sp().recommendations(
-            **generation_params_dict
-        )
-        recc_tracks_without_genre = [
-            Track(track, track_enclosed_in_item=False)
-            for track
-            in raw_recc_tracks['tracks']
-        ]
+        async with self:
+            previous_uris = self.recc_track_uris
+            self.recc_tracks = self._register_tracks(recc_tracks)
+            self._evict_unreferenced_tracks(previous_uris)
+            return self._queue_recommendation_prefetch()
+
+    def _queue_recommendation_prefetch(self):
+        """Supersede any pending prefetch with one for the current seeds"""
+        if not self.app_is_authenticated:
+            return
+        self._recc_prefetch_generation += 1
+        return State.prefetch_recommendations(self._recc_prefetch_generation)
+
+    @rx.background
+    async def prefetch_recommendations(self, generation: int):
+        """Once the seeds have stopped changing for a moment, fetch the
+        recommendations the user is likely to germinate next (the current
+        seeds with the current targets and with default targets) into the
+        shared cache, so germinating with them returns instantly
+        """
+        await asyncio.sleep(RECOMMENDATION_PREFETCH_DELAY_SECONDS)
+
+        await self._renew_auth_token()
+        async with self:
+            if generation != self._recc_prefetch_generation\
+                    or self.too_few_seeds or self.too_many_seeds:
+                return
+            sp = self.get_sp()
+            candidate_params = [
+                self._generation_params_dict(with_targets=True),
+                self._generation_params_dict(with_targets=False),
+            ]
 
-        self.recc_tracks = self._fetch_genres_for_track_list(
-            recc_tracks_without_genre
-        )
+        for generation_params_dict in candidate_params:
+            await asyncio.to_thread(
+                recommendations.prefetch_recommended_tracks,
+                sp,
+                generation_params_dict
+            )
+
+    batch_recommendations_loading: bool = False
+
+    @rx.background
+    async def fetch_batch_recommendations(self):
+        """Germinate every track of the selected playlist at once: the
+        tracks are split into groups of seeds whose recommendations are
+        fetched concurrently and merged into one ranked set
+        """
+        await self._renew_auth_token()
+        async with self:
+            seed_track_uris = [t.uri for t in self._full_track_list('playlist')]
+            if self.batch_recommendations_loading or len(seed_track_uris) == 0:
+                return
+            self.batch_recommendations_loading = True
+            sp = self.get_sp()
+            target_params = self._target_params_dict()
+
+        try:
+            recc_tracks = await asyncio.to_thread(
+                recommendations.fetch_batch_recommended_tracks,
+                sp,
+                seed_track_uris,
+                [],
+                target_params,
+                RECOMMENDATION_BATCH_GROUP_LIMIT,
+                RECOMMENDATION_BATCH_MAX_TRACKS,
+            )
+            async with self:
+                previous_uris = self.recc_track_uris
+                self.recc_tracks = self._register_tracks(recc_tracks)
+                self._evict_unreferenced_tracks(previous_uris)
+        finally:
+            async with self:
+                self.batch_recommendations_loading = False
 
     ### PLAYBACK STATE
-    def play_track_uris(
+    async def _playback_client(self) -> tuple[Spotify | None, list]:
+        """The client to control playback with, or None if the user has no
+        active device, and the events restarting the session's stopped
+        tasks. Without a poller active_devices may be out of date, so the
+        devices are fetched again first
+        """
+        await self._renew_auth_token()
+        async with self:
+            restart_tasks = self._keep_session_tasks_alive()
+            if not self.app_is_authenticated:
+                return None, restart_tasks
+            sp = self.get_sp()
+            devices = self.active_devices
+            poller_running = self._device_poller_running
+
+        if not poller_running:
+            devices = await asyncio.to_thread(fetch_active_devices, sp)
+            async with self:
+                self.active_devices = devices
+        if len(devices) == 0:
+            return None, restart_tasks
+        return sp, restart_tasks
+
+    @rx.background
+    async def play_track_uris(
             self, 
             track_uris: list[str],
         ):
-        print('Playing')
-        if len(self.active_devices) > 0:
-            self.get_sp().start_playback(
+        sp, restart_tasks = await self._playback_client()
+        if sp is not None:
+            await asyncio.to_thread(
+                sp.start_playback,
                 uris=track_uris,
             )
         # elif len(track_uris) == 1:
@@ -479,34 +867,44 @@ class State(rx.State):
         #     )['external_urls']['spotify']
         #     print(track_link)
         #     rx.redirect(track_link, external=True)
+        return restart_tasks
     
     def play_all_recommended_tracks(self):
-        self.play_track_uris(self.recc_track_uris)
+        return State.play_track_uris(self.recc_track_uris)
 
-    def queue_track_uri(self, track_uri: Track):
-        print('Queueing')
-        # ic(track_uri, self.active_devices())
-        if len(self.active_devices) > 0:
-            self.get_sp().add_to_queue(track_uri)
+    @rx.background
+    async def queue_track_uri(self, track_uri: Track):
+        sp, restart_tasks = await self._playback_client()
+        if sp is not None:
+            await asyncio.to_thread(sp.add_to_queue, track_uri)
+        return restart_tasks
 
         
     ### PLAYLISTS
-    def select_playlist(self, pl_name: str):
+    @rx.background
+    async def select_playlist(self, pl_name: str):
         """Select a playlist for display in the playlist view"""
-        self.selected_playlist = [
-            pl 
-            for pl 
-            in self.playlists 
-            if pl.playlist_name == pl_name
-        ][0]
-
-        if pl_name not in self.playlist_tracks:
-            self.fetch_tracks_for_playlist(self.selected_playlist)
+        async with self:
+            self.selected_playlist = [
+                pl 
+                for pl 
+                in self.playlists 
+                if pl.playlist_name == pl_name
+            ][0]
+
+            if self.selected_playlist.uri in self._playlist_tracks:
+                self._show_track_window('playlist', 0)
+                return
+            self.playlist_window = TrackWindow()
+            playlist = self.selected_playlist
+
+        await self._fetch_tracks_for_playlist(playlist)
 
     #### SEEDING
     def add_track_uri_to_seeds(self, uri: str, source: str):
         if uri not in [uri for uri, source in self.seed_track_uris_with_source]:
             self.seed_track_uris_with_source = self.seed_track_uris_with_source + [(uri, source)]
+            return self._queue_recommendation_prefetch()
 
     def remove_track_uri_from_seeds(self, uri: str):
         self.seed_track_uris_with_source = [
@@ -515,90 +913,132 @@ class State(rx.State):
             in self.seed_track_uris_with_source
             if u != uri
         ]
+        self._evict_unreferenced_tracks([uri])
+        return self._queue_recommendation_prefetch()
 
     def add_artist_to_seeds(self, artist_info: list[str]):
         if artist_info[0] not in self.seed_artist_uris:
             self.seed_artists_uris_names = self.seed_artists_uris_names + [artist_info]
+            return self._queue_recommendation_prefetch()
 
     def remove_artist_from_seeds_by_uri(self, artist_uri: str):
         self.seed_artists_uris_names = [
             [a[0], a[1]] for a in self.seed_artists_uris_names
             if a[0] != artist_uri
         ]
+        return self._queue_recommendation_prefetch()
 
-    @rx.var
+    @timed_var
     def seed_tracks(self) -> list[Track]:
-        return [
-            [t for t in self.all_tracks if t.uri == u][0]
-            for u in self.seed_track_uris
-        ]
+        seed_tracks = [self._track_registry.get(u) for u in self.seed_track_uris]
+        return [t for t in seed_tracks if t is not None]
 
-    @rx.var
+    @timed_var
     def seed_track_uris(self) -> list[str]:
         return [uri for uri, source in self.seed_track_uris_with_source]
     
-    @rx.var
+    @timed_var
     def seed_artist_uris(self) -> list[str]:
         return [uri_name[0] for uri_name in self.seed_artists_uris_names]
     
-    @rx.var
-    def all_tracks(self) -> list[Track]:
-        playlist_tracks_flattened = [
-            item for sublist
-            in self.playlist_tracks.values() 
-            for item in sublist
-        ]
-        return [
-            *playlist_tracks_flattened,
-            *self.liked_tracks,
-            *self.recent_tracks,
-            *self.search_tracks_including_prev,
-            *self.top_tracks
-        ]
-
-    @rx.var
-    def selected_playlist_tracks(self) -> list[Track]:
-        return self.playlist_tracks[self.selected_playlist.playlist_name]
-
-    @rx.var
+    @timed_var
     def playlist_names(self) -> list[str]:
         return [p.playlist_name for p in self.playlists]
     
-    @rx.var
+    @timed_var
     def total_seeds(self) -> int:
         return len(self.seed_artists_uris_names) + len(self.seed_tracks)
-    @rx.var
+    @timed_var
     def too_many_seeds(self) -> bool:
         return self.total_seeds > 5
     
-    @rx.var
+    @timed_var
     def too_few_seeds(self) -> bool:
         return self.total_seeds == 0
 
-    @rx.var
+    @timed_var
     def recommendations_generated(self) -> bool:
         return len(self.recc_tracks) > 0
     
-    @rx.var
+    @timed_var
     def recc_track_uris(self) -> list[str]:
         return [track.uri for track in self.recc_tracks]
     
-    @rx.var
-    def active_devices(self) -> list[dict]:
-        if self.app_is_authenticated:
-            if token_expired(json.loads(self.auth_token_json)):
-                self._refresh_auth_token()
-
-            active_devices = [d for d in self.get_sp().devices()['devices'] if d['is_active']]
-            return active_devices
-        else:
-            return []
-
-    @rx.var
+    ### DEVICE STATUS
+    active_devices: list[dict] = []
+    _device_poller_running: bool = False
+    # shared by the device poller and the library sync
+    _session_idle_deadline: float = 0
+
+    def _keep_session_tasks_alive(self) -> list:
+        """Push back the time at which the device poller and the library
+        sync give up on an idle session, returning the events that start
+        whichever of them has already given up
+        """
+        self._session_idle_deadline = time.time() + DEVICE_POLLER_IDLE_TIMEOUT_SECONDS
+        restart = []
+        if not self._device_poller_running:
+            restart.append(State.poll_active_devices)
+        if not self._library_sync_running:
+            restart.append(State.sync_library)
+        return restart
+
+    @rx.background
+    async def poll_active_devices(self):
+        """Keep active_devices up to date without computed vars calling the
+        devices endpoint. Only one poller runs per session; it stops when
+        the session logs out or has been idle for a while
+        """
+        async with self:
+            self._keep_session_tasks_alive()
+            if self._device_poller_running:
+                return
+            self._device_poller_running = True
+
+        try:
+            while True:
+                async with self:
+                    if not self.app_is_authenticated\
+                            or time.time() > self._session_idle_deadline:
+                        break
+                    auth_token_json = self.auth_token_json
+
+                try:
+                    with bulk_priority():
+                        # renew the token off the event loop, before it
+                        # expires, so events never have to refresh it
+                        # themselves
+                        token_json = await asyncio.to_thread(
+                            TOKEN_MANAGER.current_token_json,
+                            auth_token_json
+                        )
+                        if token_json != auth_token_json:
+                            async with self:
+                                self.auth_token_json = token_json
+                        access_token = parse_token_json(token_json)['access_token']
+
+                        devices = await asyncio.to_thread(
+                            cached_active_devices,
+                            SPOTIFY_CLIENTS.get(access_token),
+                            access_token
+                        )
+
+                    async with self:
+                        if devices != self.active_devices:
+                            self.active_devices = devices
+                except Exception as e:
+                    print('Device poll failed:', e)
+
+                await asyncio.sleep(DEVICE_POLL_INTERVAL_SECONDS)
+        finally:
+            async with self:
+                self._device_poller_running = False
+
+    @timed_var
     def active_device_exists(self) -> bool:
         return len(self.active_devices) > 0
     
-    @rx.var
+    @timed_var
     def active_device_name(self) -> str:
         if self.active_device_exists:
             return self.active_devices[0]['name']
@@ -616,21 +1056,54 @@ class PlaylistDialogState(State):
     def clear_name(self):
         self.pl_name = None
 
-    def create_and_dismiss(self):
-        if len(self.pl_name) > 0:
-            playlist_create_results = self.get_sp().user_playlist_create(
-                        user=self.get_sp().current_user()['id'],
-                        name=self.pl_name
-                    )
-            
-            self.get_sp().playlist_add_items(
-                playlist_id=playlist_create_results['id'],
-                items=self.recc_track_uris
-            )
-            self.change()
-            self.clear_name()
+    saving: bool = False
+    save_progress: int = 0
 
-    @rx.var
+    @rx.background
+    async def create_and_dismiss(self):
+        """Create a playlist of the recommended tracks, adding them in
+        chunks and reporting progress; the dialog closes once every chunk
+        has been written
+        """
+        await self._renew_auth_token()
+        async with self:
+            if self.saving or self.name_invalid:
+                return
+            self.saving = True
+            self.save_progress = 0
+            sp = self.get_sp()
+            access_token = parse_token_json(self.auth_token_json)['access_token']
+            name = self.pl_name
+            chunks = playlists.item_chunks(self.recc_track_uris)
+
+        try:
+            playlist_id = await asyncio.to_thread(
+                playlists.create_playlist,
+                sp,
+                access_token,
+                name
+            )
+            position = 0
+            for i, chunk in enumerate(chunks):
+                await asyncio.to_thread(
+                    playlists.add_items_chunk,
+                    sp,
+                    playlist_id,
+                    chunk,
+                    position
+                )
+                position += len(chunk)
+                async with self:
+                    self.save_progress = int(100 * (i + 1) / len(chunks))
+
+            async with self:
+                self.change()
+                self.clear_name()
+        finally:
+            async with self:
+                self.saving = False
+
+    @timed_var
     def name_invalid(self) -> bool:
         return self.pl_name is None or len(self.pl_name) == 0 
 
@@ -663,141 +1136,183 @@ class SearchState(State):
             self.year_search_enabled = True
             self.name_search_enabled = True
 
-        self.fetch_search_results()
+        return self._queue_search()
 
     def set_search_genre(self, genre: str):
         self.search_genre = genre
-        self.fetch_search_results()
+        return self._queue_search()
 
     def set_search_year(self, year: str):
         self.search_year = year
-        self.fetch_search_results()
+        return self._queue_search()
 
     def set_search_name(self, name: str):
         self.search_name = name
-        self.fetch_search_results()
+        return self._queue_search()
 
     def set_search_artist(self, artist: str):
         self.search_artist = artist
-        self.fetch_search_results()
+        return self._queue_search()
 
     num_results: int = NUM_SEARCH_RESULTS_DEFAULT
     more_results_exist: bool = False
 
     results_fetched: bool = False
 
+    # incremented for every change to the query; a search only applies its
+    # results if no newer one has been queued since
+    _search_generation: int = 0
+
     def stage_genre_for_search(self, genre):
         self.genre_search_enabled = True
         self.search_genre = genre
-        self.fetch_search_results()
+        return self._queue_search()
     
     def toggle_genre_search(self, enabled: bool):
         self.genre_search_enabled = enabled
-        self.fetch_search_results()
+        return self._queue_search()
 
     def toggle_name_search(self, enabled: bool):
         if self.search_results_type == SEARCH_RESULTS_TYPE_TRACKS:
             self.name_search_enabled = enabled
-        self.fetch_search_results()
+        return self._queue_search()
 
     def toggle_year_search(self, enabled: bool):
         if self.search_results_type == SEARCH_RESULTS_TYPE_TRACKS:
             self.year_search_enabled = enabled
-        self.fetch_search_results()
+        return self._queue_search()
 
     def toggle_artist_search(self, enabled: bool):
         self.artist_search_enabled = enabled
-        self.fetch_search_results()
-
-    def _fetch_genres_for_artist_list(
+        return self._queue_search()
+
+    def _queue_search(self):
+        """Supersede any pending search with one for the current query"""
+        self._search_generation += 1
+        METRICS.increment('search.queries_requested')
+        return SearchState.run_search(self._search_generation)
+
+    def _search_is_current(self, generation: int) -> bool:
+        return generation == self._search_generation
+
+    @rx.background
+    async def run_search(self, generation: int):
+        """Search for the current query once it has been stable for the
+        debounce window. A search superseded by a newer query stops before
+        calling the API if it can, and never applies its results
+        """
+        await asyncio.sleep(SEARCH_DEBOUNCE_SECONDS)
+
+        await self._renew_auth_token()
+        async with self:
+            if not self._search_is_current(generation):
+                METRICS.increment('search.queries_dropped')
+                return
+            query = self.combined_search_query
+            results_type = self.search_results_type
+            limit = self.num_results
+            sp = self.get_sp()
+
+        if len(query) == 0:
+            return
+
+        METRICS.increment('search.queries_issued')
+        fetched = await self._fetch_search_results(sp, query, results_type, limit, 0)
+        if fetched is None:
+            return
+        results, more_results_exist = fetched
+
+        async with self:
+            if not self._search_is_current(generation):
+                METRICS.increment('search.results_discarded')
+                return
+            self._apply_search_results(results, more_results_exist, initial=True)
+
+    async def _fetch_search_results(
             self,
-            artist_list: list[Artist]
-        ) -> list[Artist]:
-        artist_uris = [
-                a.uri
-                for a in artist_list
-            ]
-        
-        self._genre_lookup = self._updated_genre_dict_from_artist_uris(
-            artist_uris,
-            self._genre_lookup,
-        )
-
-        return [
-            artist.with_genres(
-                list(self._genre_lookup.get(artist.uri, []))
+            sp: Spotify,
+            query: str,
+            results_type: str,
+            limit: int,
+            offset: int,
+        ) -> tuple[list[Track] | list[Artist], bool] | None:
+        """search.fetch_search_results, off the event loop; None if the
+        search was rate limited, leaving the current results in place
+        """
+        try:
+            return await asyncio.to_thread(
+                search.fetch_search_results,
+                sp,
+                query,
+                results_type,
+                limit,
+                offset
             )
-            for artist
-            in artist_list
-        ]
-
-    def fetch_search_results(self, initial: bool = True):
-        """Fetch search results from API based on input text fields.
-        If initial, clear search results, otherwise add new results to list.
-        Either tracks or artists are searched for based on 
-        self.search_results_type
+        except SpotifyException as e:
+            if e.http_status != 429:
+                raise
+            METRICS.increment('search.rate_limited')
+            print('Search rate limited:', e)
+            return None
+
+    def _apply_search_results(
+            self,
+            results: list[Track] | list[Artist],
+            more_results_exist: bool,
+            initial: bool,
+        ):
+        """Show fetched search results. If initial, replace the current
+        results, otherwise add the new results to them
         """
-        print('Fetching search results')
-        query_text = self.combined_search_query
-        ic(query_text)
-        query_is_valid = len(query_text) > 0
-        
-        if query_is_valid:
-            if self.search_results_type == SEARCH_RESULTS_TYPE_TRACKS:
-                raw_artists = self.get_sp().search(
-                    q=self.combined_search_query,
-                    type='track',
-                    limit=self.num_results,
-                    offset=None if initial else len(self.search_tracks)
-                )['tracks']
-                raw_tracks_items = raw_artists['items']
-                self.more_results_exist = bool(raw_artists['next'])
-
-                search_tracks = [
-                            Track(item, track_enclosed_in_item=False)
-                            for item
-                            in raw_tracks_items
-                        ]
-
-                if initial:
-                    self.search_tracks_including_prev = self.search_tracks_including_prev + search_tracks
-                    self.search_tracks = search_tracks
-                else:
-                    self.search_tracks = self.search_tracks + search_tracks
-                    
-                
-                self.results_fetched = True
-            elif self.search_results_type == SEARCH_RESULTS_TYPE_ARTISTS:
-                raw_artists = self.get_sp().search(
-                    q=self.combined_search_query,
-                    type='artist',
-                    limit=self.num_results,
-                    offset=None if initial else len(self.artist_results)
-                )['artists']
-                raw_artist_items = raw_artists['items']
-                self.more_results_exist = bool(raw_artists['next'])
-
-                new_artist_results = [
-                            Artist(i)
-                            for i in raw_artist_items
-                        ]
-
-                if not initial:
-                    self.artist_results = self.artist_results + new_artist_results
-                else:
-                    self.artist_results = new_artist_results
-
-                    
-                self.artist_results = self._fetch_genres_for_artist_list(
-                    self.artist_results
-                )
-
-                self.results_fetched = True
-
-    def fetch_more_search_results(self):
-        self.fetch_search_results(initial=False)
-
-    @rx.var
+        if self.search_results_type == SEARCH_RESULTS_TYPE_TRACKS:
+            results = self._register_tracks(results)
+            if initial:
+                self.search_tracks = results
+            else:
+                self.search_tracks.extend(results)
+            self._remember_search_tracks(results)
+        else:
+            if initial:
+                self.artist_results = results
+            else:
+                self.artist_results.extend(results)
+
+        self.more_results_exist = more_results_exist
+        self.results_fetched = True
+
+    @rx.background
+    async def fetch_more_search_results(self):
+        await self._renew_auth_token()
+        async with self:
+            query = self.combined_search_query
+            if len(query) == 0:
+                return
+
+            current_results = self.search_tracks\
+                if self.search_results_type == SEARCH_RESULTS_TYPE_TRACKS\
+                else self.artist_results
+            generation = self._search_generation
+            results_type = self.search_results_type
+            limit = self.num_results
+            offset = len(current_results)
+            sp = self.get_sp()
+
+        fetched = await self._fetch_search_results(
+            sp,
+            query,
+            results_type,
+            limit,
+            offset
+        )
+        if fetched is None:
+            return
+        results, more_results_exist = fetched
+        async with self:
+            if not self._search_is_current(generation):
+                return
+            self._apply_search_results(results, more_results_exist, initial=False)
+
+    @timed_var
     def combined_search_query(self) -> str:
         artist_query_section = f' artist:"{self.search_artist}"'\
             if self.artist_search_enabled and len(self.search_artist) > 0\
@@ -819,10 +1334,10 @@ class SearchState(State):
             year_query_section
         ).strip()
     
-    @rx.var
+    @timed_var
     def search_disabled(self) -> bool:
         return len(self.combined_search_query) == 0
         
-    @rx.var
+    @timed_var
     def search_result_tracks(self) -> list[Track]:
         return self.search_tracks
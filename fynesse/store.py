@@ -0,0 +1,260 @@
+"""
+Persistent metadata store: track data and artist genres fetched from the API,
+the contents of playlists and each user's liked songs are kept in a local
+SQLite database, indexed by uri, so they survive restarts
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .constants import (
+    METADATA_STORE_FLUSH_THRESHOLD,
+    METADATA_STORE_PATH,
+    SQLITE_MAX_VARIABLES,
+)
+
+# Each entry upgrades the schema by one version; the database's
+# user_version records how many have been applied
+SCHEMA_MIGRATIONS = [
+    """
+    CREATE TABLE tracks (
+        uri TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE artists (
+        uri TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE artist_genres (
+        uri TEXT PRIMARY KEY,
+        genres TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE playlists (
+        uri TEXT PRIMARY KEY,
+        snapshot_id TEXT NOT NULL,
+        track_uris TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE liked_tracks (
+        user_id TEXT PRIMARY KEY,
+        items TEXT NOT NULL,
+        checked_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """,
+    # artist data was written but never read back
+    """
+    DROP TABLE artists;
+    """,
+]
+
+
+def _chunks(items: list, size: int = SQLITE_MAX_VARIABLES):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _migrate(conn: sqlite3.Connection):
+    version = _schema_version(conn)
+    for new_version, script in enumerate(
+            SCHEMA_MIGRATIONS[version:],
+            start=version + 1
+        ):
+        print('Migrating metadata store to schema version', new_version)
+        conn.executescript(script)
+        conn.execute(f'PRAGMA user_version = {new_version}')
+    conn.commit()
+
+
+class MetadataStore:
+    """SQLite-backed store of API metadata. Writes of track data are staged
+    in memory and upserted in bulk, either once enough rows are staged or
+    when flush() is called at the end of a fetch. The database is opened on
+    first use; without a path it is the one named by the
+    FYNESSE_METADATA_STORE environment variable at that point, or
+    METADATA_STORE_PATH
+    """
+    def __init__(self, path: str = None):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._staged = {'tracks': {}}
+
+    def _connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                if self.path is None:
+                    self.path = os.getenv('FYNESSE_METADATA_STORE', METADATA_STORE_PATH)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                _migrate(conn)
+                self._conn = conn
+            return self._conn
+
+    @property
+    def schema_version(self) -> int:
+        with self._lock:
+            return _schema_version(self._connection())
+
+    def _stage(self, table: str, uri: str, data: dict):
+        with self._lock:
+            self._staged[table][uri] = data
+            staged_count = sum(len(rows) for rows in self._staged.values())
+            if staged_count >= METADATA_STORE_FLUSH_THRESHOLD:
+                self.flush()
+
+    def stage_track(self, uri: str, track_dict: dict):
+        self._stage('tracks', uri, track_dict)
+
+    def flush(self):
+        """Upsert every staged row in one transaction"""
+        with self._lock:
+            if all(len(rows) == 0 for rows in self._staged.values()):
+                return
+            now = time.time()
+            for table, rows in self._staged.items():
+                if len(rows) == 0:
+                    continue
+                self._connection().executemany(
+                    f'INSERT INTO {table} (uri, data, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(uri) DO UPDATE SET '
+                    'data = excluded.data, updated_at = excluded.updated_at',
+                    [(uri, json.dumps(data), now) for uri, data in rows.items()]
+                )
+                rows.clear()
+            self._connection().commit()
+
+    def _get_many(
+            self,
+            table: str,
+            column: str,
+            uris: list[str],
+            max_age: float = None,
+        ) -> dict[str, object]:
+        found = {}
+        oldest = 0 if max_age is None else time.time() - max_age
+        with self._lock:
+            staged = self._staged.get(table, {})
+            for uri in uris:
+                if uri in staged:
+                    found[uri] = staged[uri]
+
+            remaining = [uri for uri in set(uris) if uri not in found]
+            for chunk in _chunks(remaining):
+                placeholders = ', '.join('?' * len(chunk))
+                rows = self._connection().execute(
+                    f'SELECT uri, {column} FROM {table} '
+                    f'WHERE uri IN ({placeholders}) AND updated_at >= ?',
+                    [*chunk, oldest]
+                ).fetchall()
+                found.update({uri: json.loads(value) for uri, value in rows})
+        return found
+
+    def get_tracks(self, uris: list[str], max_age: float = None) -> dict[str, dict]:
+        """Stored track dicts for whichever of uris are known (and, if
+        max_age is given, were updated less than max_age seconds ago)
+        """
+        return self._get_many('tracks', 'data', uris, max_age)
+
+    def get_artist_genres(
+            self,
+            uris: list[str],
+            max_age: float = None,
+        ) -> dict[str, list[str]]:
+        return self._get_many('artist_genres', 'genres', uris, max_age)
+
+    def upsert_artist_genres(self, genre_lookup: dict[str, list[str]]):
+        with self._lock:
+            now = time.time()
+            self._connection().executemany(
+                'INSERT INTO artist_genres (uri, genres, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(uri) DO UPDATE SET '
+                'genres = excluded.genres, updated_at = excluded.updated_at',
+                [
+                    (uri, json.dumps(genres), now)
+                    for uri, genres in genre_lookup.items()
+                ]
+            )
+            self._connection().commit()
+
+    def get_playlist_snapshot_ids(self, uris: list[str]) -> dict[str, str]:
+        """snapshot_id of the stored contents of whichever playlists are known"""
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(set(uris))):
+                placeholders = ', '.join('?' * len(chunk))
+                found.update(self._connection().execute(
+                    f'SELECT uri, snapshot_id FROM playlists WHERE uri IN ({placeholders})',
+                    chunk
+                ).fetchall())
+        return found
+
+    def get_playlist(self, uri: str) -> tuple[str, list[str]] | None:
+        """snapshot_id and track uris, in order, of a stored playlist"""
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT snapshot_id, track_uris FROM playlists WHERE uri = ?',
+                [uri]
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def upsert_playlist(self, uri: str, snapshot_id: str, track_uris: list[str]):
+        with self._lock:
+            self._connection().execute(
+                'INSERT INTO playlists (uri, snapshot_id, track_uris, updated_at) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT(uri) DO UPDATE SET '
+                'snapshot_id = excluded.snapshot_id, '
+                'track_uris = excluded.track_uris, updated_at = excluded.updated_at',
+                [uri, snapshot_id, json.dumps(track_uris), time.time()]
+            )
+            self._connection().commit()
+
+    def get_liked_tracks(self, user_id: str) -> tuple[list[list[str]], float] | None:
+        """A user's stored liked songs as [added_at, uri] pairs, newest
+        first, and when they were last checked against the API
+        """
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT items, checked_at FROM liked_tracks WHERE user_id = ?',
+                [user_id]
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def upsert_liked_tracks(
+            self,
+            user_id: str,
+            items: list[list[str]],
+            checked_at: float,
+        ):
+        with self._lock:
+            self._connection().execute(
+                'INSERT INTO liked_tracks (user_id, items, checked_at, updated_at) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET '
+                'items = excluded.items, checked_at = excluded.checked_at, '
+                'updated_at = excluded.updated_at',
+                [user_id, json.dumps(items), checked_at, time.time()]
+            )
+            self._connection().commit()
+
+
+METADATA_STORE = MetadataStore()
+atexit.register(METADATA_STORE.flush)
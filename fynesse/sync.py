@@ -0,0 +1,266 @@
+"""
+Library sync: playlist contents are kept in the metadata store along with
+the snapshot_id they were fetched at. A playlist's snapshot_id only changes
+when the playlist does, so one sweep of the playlist list tells which stored
+contents are still current and which playlists need fetching again.
+Liked songs are stored per user with the time each was added; as the API
+lists them newest first, only pages of songs added since the last sync need
+fetching, and songs no longer liked are found by bisecting for the pages
+that disagree with the stored list
+"""
+import math
+import random
+import time
+
+from spotipy import Spotify
+
+from . import library
+from .constants import LIBRARY_BATCH_SIZE, LIKED_TRACKS_CHECK_INTERVAL_SECONDS
+from .data import Playlist, Track
+from .metrics import METRICS
+from .pagination import call_respecting_rate_limit, fetch_all_items
+from .playlists import current_user_id
+from .store import METADATA_STORE
+
+
+def stored_tracks(track_uris: list[str]) -> list[Track] | None:
+    """Tracks rebuilt from the metadata store, in order, or None if any of
+    them is not stored
+    """
+    track_dicts = METADATA_STORE.get_tracks(track_uris)
+    if len(track_dicts) < len(set(track_uris)):
+        return None
+    return [
+        Track(track_dicts[uri], track_enclosed_in_item=False, from_store=True)
+        for uri in track_uris
+    ]
+
+
+def changed_playlists(playlists: list[Playlist]) -> list[Playlist]:
+    """Playlists whose contents are not stored at their current snapshot_id"""
+    stored_snapshot_ids = METADATA_STORE.get_playlist_snapshot_ids(
+        [p.uri for p in playlists]
+    )
+    return [
+        p for p in playlists
+        if not p.snapshot_id or stored_snapshot_ids.get(p.uri) != p.snapshot_id
+    ]
+
+
+def refresh_playlist_tracks(sp: Spotify, playlist: Playlist) -> list[Track]:
+    """Fetch every track of a playlist and store its contents"""
+    tracks = library.fetch_playlist_tracks(sp, playlist.uri)
+    METADATA_STORE.upsert_playlist(
+        playlist.uri,
+        playlist.snapshot_id,
+        [t.uri for t in tracks]
+    )
+    METRICS.increment('sync.playlists_fetched')
+    return tracks
+
+
+def playlist_tracks(sp: Spotify, playlist: Playlist) -> list[Track]:
+    """A playlist's tracks, from the store if they were stored at the
+    playlist's current snapshot_id, otherwise fetched and stored
+    """
+    if playlist.snapshot_id:
+        stored = METADATA_STORE.get_playlist(playlist.uri)
+        if stored is not None and stored[0] == playlist.snapshot_id:
+            tracks = stored_tracks(stored[1])
+            if tracks is not None:
+                METRICS.increment('sync.playlists_unchanged')
+                return tracks
+    return refresh_playlist_tracks(sp, playlist)
+
+
+def _liked_key(item: dict) -> list[str]:
+    return [item['added_at'], item['track']['uri']]
+
+
+def _liked_page(sp: Spotify, offset: int) -> dict:
+    return call_respecting_rate_limit(
+        sp.current_user_saved_tracks,
+        limit=LIBRARY_BATCH_SIZE,
+        offset=offset
+    )
+
+
+def _first_disagreement(page: dict, items: list[list[str]], offset: int) -> int | None:
+    """Offset of the first song of a page at offset that is not the stored
+    song at the same offset, or None if the page agrees with the store
+    """
+    for i, item in enumerate(page['items']):
+        if offset + i >= len(items) or _liked_key(item) != items[offset + i]:
+            return offset + i
+    return None
+
+
+def _drop_unliked(
+        sp: Spotify,
+        items: list[list[str]],
+        total: int,
+        pages: dict[int, dict],
+    ) -> list[list[str]] | None:
+    """items without the songs that are no longer liked, or None if they
+    cannot be found for less than a full fetch. The API's list is items
+    with those songs taken out, so its pages agree with items up to the
+    first of them: bisecting over pages finds it, it is dropped, and the
+    search repeats until the counts match. pages holds the pages already
+    fetched, by offset
+    """
+    items = list(items)
+    page_count = max(1, math.ceil(total / LIBRARY_BATCH_SIZE))
+    fetched = 0
+    # every page before lo agrees with items
+    lo = 0
+    while len(items) > total:
+        hi = page_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * LIBRARY_BATCH_SIZE
+            if offset not in pages:
+                if fetched >= page_count:
+                    return None
+                pages[offset] = _liked_page(sp, offset)
+                fetched += 1
+            if _first_disagreement(pages[offset], items, offset) is None:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == page_count:
+            # every listed song agrees, so the unliked ones were the oldest
+            return items[:total]
+
+        offset = lo * LIBRARY_BATCH_SIZE
+        first = _first_disagreement(pages[offset], items, offset)
+        listed = _liked_key(pages[offset]['items'][first - offset])
+        try:
+            next_listed = items.index(listed, first)
+        except ValueError:
+            # not a removal: the song is listed out of its stored order
+            return None
+        del items[first:next_listed]
+    if len(items) != total:
+        return None
+    # a song listed out of its stored order can pass for the removal of the
+    # songs it skipped; the page they were dropped from shows it
+    offset = lo * LIBRARY_BATCH_SIZE
+    if _first_disagreement(pages[offset], items, offset) is not None:
+        return None
+    return items
+
+
+def refetch_liked_tracks(sp: Spotify, access_token: str) -> str:
+    """Fetch and store every one of the user's liked songs, returning the
+    user's id
+    """
+    user_id = current_user_id(sp, access_token)
+    items = fetch_all_items(sp.current_user_saved_tracks, page_size=LIBRARY_BATCH_SIZE)
+    for item in items:
+        Track(item)  # stages the track's data in the store
+    METADATA_STORE.flush()
+    METADATA_STORE.upsert_liked_tracks(
+        user_id,
+        [_liked_key(item) for item in items],
+        checked_at=time.time()
+    )
+    METRICS.increment('sync.liked_refetched')
+    return user_id
+
+
+def sync_liked_tracks(sp: Spotify, access_token: str) -> str:
+    """Bring the user's stored liked songs up to date, returning the user's
+    id, or '' if they are not stored or could not be updated incrementally.
+    Pages are fetched until one reaches a stored (added_at, uri) pair, so
+    usually only the first is. Removals show up as more stored songs than
+    the API's total, and are located with _drop_unliked; every
+    LIKED_TRACKS_CHECK_INTERVAL_SECONDS a randomly chosen page is also
+    compared with the stored songs at its offset. Songs that cannot be
+    located, or a page that disagrees, leave the songs to be fetched again
+    in full
+    """
+    user_id = current_user_id(sp, access_token)
+    stored = METADATA_STORE.get_liked_tracks(user_id)
+    if stored is None:
+        return ''
+    stored_items, checked_at = stored
+    known = {tuple(key) for key in stored_items}
+
+    new_items = []
+    pages = {}
+    offset = 0
+    while True:
+        page = _liked_page(sp, offset)
+        pages[offset] = page
+        if offset == 0:
+            total = page['total']
+        for item in page['items']:
+            if tuple(_liked_key(item)) in known:
+                break
+            new_items.append(item)
+        else:
+            offset += len(page['items'])
+            if page['next'] is not None and len(page['items']) > 0:
+                continue
+        break
+
+    new_tracks = [Track(item) for item in new_items]
+    METADATA_STORE.flush()
+    new_uris = {t.uri for t in new_tracks}
+    items = [_liked_key(item) for item in new_items] + [
+        key for key in stored_items if key[1] not in new_uris
+    ]
+    removed = 0
+    if len(items) > total:
+        remaining = _drop_unliked(sp, items, total, pages)
+        if remaining is not None:
+            removed = len(items) - len(remaining)
+            items = remaining
+    if len(items) != total:
+        METRICS.increment('sync.liked_count_mismatch')
+        return ''
+
+    now = time.time()
+    if len(items) > 0 and now - checked_at > LIKED_TRACKS_CHECK_INTERVAL_SECONDS:
+        offset = random.randrange(0, len(items), LIBRARY_BATCH_SIZE)
+        page = pages.get(offset) or _liked_page(sp, offset)
+        if [_liked_key(item) for item in page['items']]\
+                != items[offset:offset + LIBRARY_BATCH_SIZE]:
+            METRICS.increment('sync.liked_check_mismatch')
+            return ''
+        checked_at = now
+    elif len(new_items) == 0 and removed == 0:
+        return user_id
+
+    METADATA_STORE.upsert_liked_tracks(user_id, items, checked_at)
+    METRICS.increment('sync.liked_tracks_added', len(new_items))
+    METRICS.increment('sync.liked_tracks_removed', removed)
+    return user_id
+
+
+def liked_tracks_range(
+        sp: Spotify,
+        user_id: str,
+        offset: int,
+        count: int,
+    ) -> tuple[list[Track], int]:
+    """count liked tracks starting at offset, and the total number of liked
+    tracks. Read from the store if user_id's liked songs are stored (as
+    they are once sync_liked_tracks has returned it), otherwise fetched
+    """
+    if user_id:
+        stored = METADATA_STORE.get_liked_tracks(user_id)
+        if stored is not None:
+            stored_items = stored[0]
+            tracks = stored_tracks([
+                uri for added_at, uri in stored_items[offset:offset + count]
+            ])
+            if tracks is not None:
+                return tracks, len(stored_items)
+
+    if count <= LIBRARY_BATCH_SIZE:
+        return library.fetch_liked_tracks(sp, offset)
+    return library.fetch_liked_track_batches(
+        sp,
+        list(range(offset, offset + count, LIBRARY_BATCH_SIZE))
+    )
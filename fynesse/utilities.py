@@ -1,4 +1,3 @@
-import time
 
 def flatten_list_of_lists(list_of_lists: list[list]) -> list:
     return [
@@ -18,11 +17,3 @@ def src_set_from_images_list(images_list: list[dict[str, str]]) -> str:
             f"{img['url']} {img['width']}w"
             for img in images_list
         ])
-
-def token_expired(token_dict: dict) -> bool:
-    return token_dict['expires_at'] <= time.time()
-
-def add_token_expiry_time(token_dict: dict) -> dict:
-    print(token_dict)
-    token_dict['expires_at'] = token_dict['expires_in'] + int(time.time())
-    return token_dict 
\ No newline at end of file
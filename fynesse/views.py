@@ -16,17 +16,15 @@ def top_tracks_panel() -> rx.Component:
             on_click=State.fetch_genres_top_tracks,
             is_disabled=State.top_tracks_have_genre,
         ),
-        rx.chakra.vstack(
-            rx.foreach(
-                State.top_tracks,
-                lambda x: track_card(
-                                track=x,
-                                show_genres=True,
-                                artists_interactive=True,
-                                buttons=[track_add_seed_button(x, source='recent')]
-                            )
-            ),
-            width='100%'
+        windowed_track_list(
+            State.top_window,
+            'top',
+            lambda x: track_card(
+                            track=x,
+                            show_genres=True,
+                            artists_interactive=True,
+                            buttons=[track_add_seed_button(x, source='recent')]
+                        )
         )
     )
 
@@ -42,17 +40,22 @@ def playlist_browser_panel() -> rx.Component:
                 text=ARTIST_GENRES_BUTTON_TEXT,
                 on_click=State.fetch_genres_selected_pl,
                 is_disabled=State.selected_playlist.has_genres,
-            )
+            ),
+            sub_pane_button(
+                text=GERMINATE_PLAYLIST_BUTTON_TEXT,
+                on_click=State.fetch_batch_recommendations,
+                is_disabled=State.batch_recommendations_loading,
+            ),
         ),
-        rx.foreach(
-            State.selected_playlist_tracks,
+        windowed_track_list(
+            State.playlist_window,
+            'playlist',
             lambda x: track_card(
                             track=x,
                             show_genres=True,
                             artists_interactive=True,
                             buttons=[track_add_seed_button(x, source='playlist')]
-                        ),
-            width='100%'
+                        )
         ),
         align_items='left',
     )
@@ -66,8 +69,9 @@ def liked_songs_view_panel() -> rx.Component:
             is_disabled=State.liked_tracks_have_genre,
         ),
         rx.chakra.vstack(
-            rx.foreach(
-                State.liked_tracks,
+            windowed_track_list(
+                State.liked_window,
+                'liked',
                 lambda x: track_card(
                                 track=x,
                                 show_genres=True,
@@ -75,7 +79,27 @@ def liked_songs_view_panel() -> rx.Component:
                                 buttons=[track_add_seed_button(x, source='liked')]
                             )
             ),
-            sub_pane_button(text=LOAD_MORE_BUTTON_TEXT, on_click=State.fetch_liked_tracks_batch),
+            rx.cond(
+                State.liked_tracks_loading,
+                rx.chakra.progress(
+                    value=State.liked_tracks_progress,
+                    color_scheme='green',
+                    width='100%'
+                ),
+                rx.chakra.hstack(
+                    sub_pane_button(
+                        text=LOAD_MORE_BUTTON_TEXT,
+                        on_click=State.fetch_liked_tracks_batch,
+                        is_disabled=State.all_liked_tracks_loaded,
+                    ),
+                    sub_pane_button(
+                        text=LOAD_ALL_BUTTON_TEXT,
+                        on_click=State.load_all_liked_tracks,
+                        is_disabled=State.all_liked_tracks_loaded,
+                    ),
+                    width='100%'
+                ),
+            ),
             width='100%'
         ),
     )
@@ -88,17 +112,15 @@ def recent_tracks_panel() -> rx.Component:
             on_click=State.fetch_genres_recent_tracks,
             is_disabled=State.recent_tracks_have_genre,
         ),
-        rx.chakra.vstack(
-            rx.foreach(
-                State.recent_tracks,
-                lambda x: track_card(
-                                track=x,
-                                show_genres=True,
-                                artists_interactive=True,
-                                buttons=[track_add_seed_button(x, source='recent')]
-                            )
-            ),
-            width='100%'
+        windowed_track_list(
+            State.recent_window,
+            'recent',
+            lambda x: track_card(
+                            track=x,
+                            show_genres=True,
+                            artists_interactive=True,
+                            buttons=[track_add_seed_button(x, source='recent')]
+                        )
         )
     )
 
@@ -315,10 +337,18 @@ def playlist_create_dialog():
                     )
                 ),
                 rx.chakra.alert_dialog_footer(
-                    rx.chakra.button(
-                        CREATE_PLAYLIST_BUTTON_TEXT,
-                        on_click=PlaylistDialogState.create_and_dismiss(),
-                        is_disabled=PlaylistDialogState.name_invalid
+                    rx.cond(
+                        PlaylistDialogState.saving,
+                        rx.chakra.progress(
+                            value=PlaylistDialogState.save_progress,
+                            color_scheme='green',
+                            width='100%'
+                        ),
+                        rx.chakra.button(
+                            CREATE_PLAYLIST_BUTTON_TEXT,
+                            on_click=PlaylistDialogState.create_and_dismiss(),
+                            is_disabled=PlaylistDialogState.name_invalid
+                        ),
                     )
                 ),
             )
@@ -0,0 +1,18 @@
+import pytest
+
+from fynesse.store import METADATA_STORE
+
+
+@pytest.fixture(autouse=True, scope='session')
+def metadata_store_path(tmp_path_factory):
+    """Keep the metadata store the tests write to out of the working
+    directory; it is opened on first use, after this has run
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv(
+            'FYNESSE_METADATA_STORE',
+            str(tmp_path_factory.mktemp('store') / 'metadata.db')
+        )
+        yield
+        # write out what the tests staged here rather than at exit
+        METADATA_STORE.flush()
@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+
+from fynesse.auth import TokenManager
+
+
+def _expiring_token_json() -> str:
+    return json.dumps({
+        'access_token': 'old-access-token',
+        'refresh_token': 'refresh-token',
+        'expires_in': 3600,
+        'expires_at': time.time(),
+    })
+
+
+def _renewing_manager(requests: list) -> TokenManager:
+    manager = TokenManager()
+
+    def request_token(data):
+        requests.append(data)
+        time.sleep(0.1)
+        return {'access_token': 'new-access-token', 'expires_at': time.time() + 3600}
+
+    manager._request_token = request_token
+    return manager
+
+
+def test_concurrent_renewals_share_one_refresh():
+    requests = []
+    manager = _renewing_manager(requests)
+    auth_token_json = _expiring_token_json()
+    access_tokens = []
+
+    def renew():
+        access_tokens.append(manager.access_token(auth_token_json))
+
+    threads = [threading.Thread(target=renew) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(requests) == 1
+    assert access_tokens == ['new-access-token'] * 4
+
+
+def test_latest_token_does_not_refresh():
+    requests = []
+    manager = _renewing_manager(requests)
+    auth_token_json = _expiring_token_json()
+
+    assert manager.latest_token_json(auth_token_json) == auth_token_json
+    assert requests == []
+
+    renewed = manager.current_token_json(auth_token_json)
+    # another session holding the old snapshot sees the renewed token
+    assert manager.latest_token_json(auth_token_json) == renewed
+    assert json.loads(renewed)['refresh_token'] == 'refresh-token'
+    assert len(requests) == 1
@@ -0,0 +1,29 @@
+import time
+
+from fynesse.cache import TTLCache
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+
+    time.sleep(0.1)
+
+    assert 'key' not in cache
+    assert cache.get('key', 'default') == 'default'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert len(cache) == 2
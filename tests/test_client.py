@@ -0,0 +1,60 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from spotipy import SpotifyException
+
+from fynesse.client import ScheduledSpotify, _build_session
+from fynesse.metrics import METRICS
+
+
+@pytest.fixture
+def rate_limited_server():
+    """Local server answering every request with 429 and Retry-After,
+    counting the requests it receives
+    """
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            body = b'{"error": {"status": 429}}'
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f'http://{host}:{port}/v1/', hits
+    server.shutdown()
+
+
+def test_transport_does_not_retry_rate_limited_responses(rate_limited_server):
+    prefix, hits = rate_limited_server
+    retries_before = METRICS.counter('api.retries.429')
+
+    response = _build_session().get(prefix + 'me', timeout=5)
+
+    assert response.status_code == 429
+    assert len(hits) == 1
+    assert METRICS.counter('api.retries.429') == retries_before
+
+
+def test_client_sends_rate_limited_call_once(rate_limited_server):
+    prefix, hits = rate_limited_server
+    sp = ScheduledSpotify(auth='test-token', requests_session=_build_session())
+    sp.prefix = prefix
+
+    with pytest.raises(SpotifyException) as e:
+        sp.current_user()
+
+    assert e.value.http_status == 429
+    assert len(hits) == 1
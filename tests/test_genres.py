@@ -0,0 +1,53 @@
+import threading
+import time
+
+from fynesse import genres
+from fynesse.constants import ARTISTS_CHUNK_SIZE, GENRE_FETCH_MAX_WORKERS
+from fynesse.scheduler import BULK, bulk_priority, current_priority
+
+
+class BlockingBulkSpotify:
+    """Answers artists() at once for interactive calls, and holds bulk calls
+    until released
+    """
+    def __init__(self):
+        self.release = threading.Event()
+
+    def artists(self, uris: list[str]) -> dict:
+        if current_priority() == BULK:
+            self.release.wait(10)
+        return {'artists': [{'uri': uri, 'genres': ['genre']} for uri in uris]}
+
+
+def test_interactive_lookup_does_not_wait_for_bulk_backfill():
+    sp = BlockingBulkSpotify()
+    # enough chunks to occupy every bulk worker
+    bulk_uris = [
+        f'spotify:artist:bulk{i}'
+        for i in range(GENRE_FETCH_MAX_WORKERS * ARTISTS_CHUNK_SIZE + 1)
+    ]
+
+    def backfill():
+        with bulk_priority():
+            genres.genre_lookup_for_artist_uris(sp, bulk_uris)
+
+    backfill_thread = threading.Thread(target=backfill)
+    backfill_thread.start()
+    try:
+        while bulk_uris[-1] not in genres._in_flight:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        lookup = genres.genre_lookup_for_artist_uris(
+            sp,
+            [bulk_uris[-1], 'spotify:artist:searched']
+        )
+        assert time.monotonic() - start < 2
+        assert lookup == {
+            bulk_uris[-1]: ['genre'],
+            'spotify:artist:searched': ['genre'],
+        }
+        assert backfill_thread.is_alive()
+    finally:
+        sp.release.set()
+        backfill_thread.join()
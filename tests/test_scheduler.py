@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from fynesse.scheduler import RequestScheduler
+
+
+def _scheduler() -> RequestScheduler:
+    return RequestScheduler(app_rate=10, app_burst=10, user_rate=10, user_burst=10)
+
+
+def test_acquire_refuses_to_block_the_event_loop():
+    scheduler = _scheduler()
+
+    async def handler():
+        scheduler.acquire('user')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(handler())
+
+
+def test_acquire_from_worker_thread_of_running_loop():
+    scheduler = _scheduler()
+
+    async def handler():
+        await asyncio.to_thread(scheduler.acquire, 'user')
+
+    asyncio.run(handler())
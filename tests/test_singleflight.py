@@ -0,0 +1,61 @@
+import threading
+
+from fynesse.singleflight import SingleFlight
+
+
+def _concurrently(count: int, fn) -> list:
+    """Results of count threads calling fn, or the exceptions they raised"""
+    results = []
+
+    def call():
+        try:
+            results.append(fn())
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    def do():
+        return flight.do('key', fetch)
+
+    timer = threading.Timer(0.1, release.set)
+    timer.start()
+    results = _concurrently(4, do)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [('result', False)] + [('result', True)] * 3
+    # the key is free again once the call is over
+    assert flight.do('key', lambda: 'again') == ('again', False)
+
+
+def test_waiters_share_the_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('fetch failed')
+
+    timer = threading.Timer(0.1, release.set)
+    timer.start()
+    results = _concurrently(3, lambda: flight.do('key', fail))
+
+    assert len(results) == 3
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.do('key', lambda: 'again') == ('again', False)
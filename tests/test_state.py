@@ -0,0 +1,253 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from reflex.app import process
+from reflex.event import Event
+from reflex.state import _substate_key
+from spotipy import SpotifyException
+
+from benchmarks.fixtures import track
+from fynesse.data import Playlist, Track
+from fynesse.fynesse import app
+from fynesse import state as state_module
+from fynesse.state import State
+
+
+class RecordingNamespace:
+    """Stands in for the websocket namespace, keeping every update pushed
+    to the client
+    """
+    def __init__(self):
+        self.updates = []
+
+    async def emit_update(self, update, sid):
+        self.updates.append(update)
+
+
+async def _state(token: str) -> State:
+    root = await app.state_manager.get_state(_substate_key(token, State))
+    return root.substates['state']
+
+
+async def _send(token: str, name: str, payload: dict) -> list[str]:
+    """Process an event and its background tasks, returning the names of
+    the events it asked the client to send next
+    """
+    namespace = RecordingNamespace()
+    app.event_namespace = namespace
+    event = Event(
+        token=token,
+        name=name,
+        payload=payload,
+        router_data={'pathname': '/', 'query': {}},
+    )
+    async for update in process(app, event, 'test-sid', {}, '127.0.0.1'):
+        namespace.updates.append(update)
+    while app.background_tasks:
+        await asyncio.sleep(0.01)
+    return [e.name for update in namespace.updates for e in update.events]
+
+
+def _authenticate(state: State):
+    state.auth_token_json = json.dumps({
+        'access_token': 'test-access-token',
+        'refresh_token': 'test-refresh-token',
+        'expires_in': 3600,
+        'expires_at': time.time() + 3600,
+    })
+
+
+PLAYBACK_EVENTS = [
+    ('state.state.play_track_uris', {'track_uris': ['spotify:track:1']}),
+    ('state.state.queue_track_uri', {'track_uri': 'spotify:track:1'}),
+]
+
+
+@pytest.mark.parametrize('name, payload', PLAYBACK_EVENTS)
+def test_playback_restarts_stopped_device_poller(name, payload):
+    async def run():
+        token = f'stopped-{name}'
+        state = await _state(token)
+        state._device_poller_running = False
+        return await _send(token, name, payload)
+
+    assert 'state.state.poll_active_devices' in asyncio.run(run())
+
+
+@pytest.mark.parametrize('name, payload', PLAYBACK_EVENTS)
+def test_playback_leaves_running_device_poller(name, payload):
+    async def run():
+        token = f'running-{name}'
+        state = await _state(token)
+        state._device_poller_running = True
+        return await _send(token, name, payload)
+
+    assert 'state.state.poll_active_devices' not in asyncio.run(run())
+
+
+def test_page_track_window_rejects_unknown_list():
+    async def run():
+        state = await _state('unknown-list')
+        with pytest.raises(ValueError):
+            State.page_track_window.fn(state, 'search', 1)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('name', [
+    'state.state.fetch_recommendations',
+    'state.state.fetch_batch_recommendations',
+])
+def test_recommendations_without_seeds_keep_current_ones(name):
+    async def run():
+        token = f'no-seeds-{name}'
+        state = await _state(token)
+        state.recc_tracks = [Track(track(1), track_enclosed_in_item=False)]
+        await _send(token, name, {})
+        return state.recc_track_uris
+
+    assert asyncio.run(run()) == [track(1)['uri']]
+
+
+def test_any_event_restarts_stopped_session_tasks():
+    async def run():
+        token = 'idle-session'
+        state = await _state(token)
+        _authenticate(state)
+        state._device_poller_running = False
+        state._library_sync_running = False
+        state._session_idle_deadline = 0
+        events = await _send(
+            token,
+            'state.state.page_track_window',
+            {'list_name': 'liked', 'direction': 1}
+        )
+        return events, state._session_idle_deadline
+
+    events, deadline = asyncio.run(run())
+    assert 'state.state.poll_active_devices' in events
+    assert 'state.state.sync_library' in events
+    assert deadline > time.time()
+
+
+def test_device_poller_survives_failed_poll(monkeypatch):
+    calls = []
+
+    async def run():
+        token = 'failing-poll'
+        state = await _state(token)
+        _authenticate(state)
+
+        def failing_token_json(auth_token_json):
+            calls.append(auth_token_json)
+            if len(calls) == 2:
+                state._session_idle_deadline = 0
+            raise RuntimeError('token endpoint unavailable')
+
+        monkeypatch.setattr(
+            state_module.TOKEN_MANAGER,
+            'current_token_json',
+            failing_token_json
+        )
+        monkeypatch.setattr(state_module, 'DEVICE_POLL_INTERVAL_SECONDS', 0.01)
+        await _send(token, 'state.state.poll_active_devices', {})
+        return state._device_poller_running
+
+    assert asyncio.run(run()) is False
+    assert len(calls) == 2
+
+
+def test_expiring_token_is_renewed_off_the_event_loop(monkeypatch):
+    refresh_threads = []
+
+    def request_token(data):
+        refresh_threads.append(threading.current_thread())
+        return {'access_token': 'renewed', 'expires_at': time.time() + 3600}
+
+    monkeypatch.setattr(state_module.TOKEN_MANAGER, '_request_token', request_token)
+    monkeypatch.setattr(state_module.library, 'fetch_recent_tracks', lambda sp: [])
+
+    async def run():
+        token = 'expiring-token'
+        state = await _state(token)
+        _authenticate(state)
+        state.auth_token_json = json.dumps({
+            **json.loads(state.auth_token_json),
+            'refresh_token': 'expiring-refresh-token',
+            'expires_at': time.time(),
+        })
+        await _send(token, 'state.state.fetch_recent_tracks', {})
+        return json.loads(state.auth_token_json)['access_token']
+
+    assert asyncio.run(run()) == 'renewed'
+    assert len(refresh_threads) == 1
+    assert refresh_threads[0] is not threading.main_thread()
+
+
+def _playlist(name: str, uri: str) -> Playlist:
+    return Playlist({
+        'name': name,
+        'uri': uri,
+        'description': '',
+        'public': True,
+        'snapshot_id': 'snapshot',
+    })
+
+
+def test_renamed_playlist_keeps_its_tracks():
+    async def run():
+        state = await _state('renamed-playlist')
+        state.playlists = [_playlist('Mix', 'spotify:playlist:a')]
+        state.selected_playlist = state.playlists[0]
+        state._store_playlist_tracks(
+            'spotify:playlist:a',
+            [Track(track(2), track_enclosed_in_item=False)]
+        )
+        state._update_playlists([
+            _playlist('Mix', 'spotify:playlist:b'),
+            _playlist('Mix (2)', 'spotify:playlist:a'),
+        ])
+        state._show_track_window('playlist', 0)
+        return state.selected_playlist.playlist_name, state.playlist_window
+
+    name, window = asyncio.run(run())
+    assert name == 'Mix (2)'
+    assert [t.uri for t in window.tracks] == [track(2)['uri']]
+
+
+def test_library_fetch_waits_for_authentication():
+    async def run():
+        token = 'not-authenticated'
+        state = await _state(token)
+        await _send(token, 'state.state.initial_library_fetch', {})
+        return state.library_fetched
+
+    assert asyncio.run(run()) is False
+
+
+def test_rate_limited_search_keeps_current_results(monkeypatch):
+    def rate_limited(*args):
+        raise SpotifyException(429, -1, 'Rate limited; request not sent')
+
+    monkeypatch.setattr(state_module.search, 'fetch_search_results', rate_limited)
+    monkeypatch.setattr(state_module, 'SEARCH_DEBOUNCE_SECONDS', 0)
+
+    async def run():
+        token = 'rate-limited-search'
+        state = await _state(token)
+        _authenticate(state)
+        search_state = state.substates['search_state']
+        search_state.search_name = 'radiohead'
+        events = await _send(
+            token,
+            'state.state.search_state.run_search',
+            {'generation': search_state._search_generation}
+        )
+        return events, search_state.results_fetched
+
+    events, results_fetched = asyncio.run(run())
+    assert '_alert' not in events
+    assert results_fetched is False
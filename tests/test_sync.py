@@ -0,0 +1,125 @@
+import time
+
+from benchmarks.fixtures import track
+from fynesse import sync
+from fynesse.constants import LIBRARY_BATCH_SIZE
+from fynesse.metrics import METRICS
+from fynesse.store import METADATA_STORE
+
+
+class FakeSavedTracks:
+    """Stands in for the client, serving a user's liked songs newest first
+    and recording the offset of every page fetched
+    """
+    def __init__(self, user_id: str, count: int):
+        self.user_id = user_id
+        self._clock = 0
+        # (added_at, track index), newest first
+        self.liked = []
+        for n in range(count):
+            self.like(n)
+        self.offsets = []
+
+    def like(self, n: int):
+        self.unlike(n)
+        self._clock += 1
+        added_at = time.strftime(
+            '%Y-%m-%dT%H:%M:%SZ',
+            time.gmtime(1_600_000_000 + self._clock * 60)
+        )
+        self.liked.insert(0, (added_at, n))
+
+    def unlike(self, n: int):
+        self.liked = [(added_at, m) for added_at, m in self.liked if m != n]
+
+    def keys(self) -> list[list[str]]:
+        return [[added_at, track(n)['uri']] for added_at, n in self.liked]
+
+    def current_user(self) -> dict:
+        return {'id': self.user_id}
+
+    def current_user_saved_tracks(self, limit: int, offset: int) -> dict:
+        self.offsets.append(offset)
+        total = len(self.liked)
+        return {
+            'items': [
+                {'added_at': added_at, 'track': track(n)}
+                for added_at, n in self.liked[offset:offset + limit]
+            ],
+            'limit': limit,
+            'offset': offset,
+            'total': total,
+            'next': 'next page' if offset + limit < total else None,
+        }
+
+
+def _synced_library(user_id: str, count: int) -> FakeSavedTracks:
+    """A library of count songs, already stored by a full fetch"""
+    sp = FakeSavedTracks(user_id, count)
+    assert sync.refetch_liked_tracks(sp, user_id) == user_id
+    sp.offsets.clear()
+    return sp
+
+
+def _stored(user_id: str) -> list[list[str]]:
+    return METADATA_STORE.get_liked_tracks(user_id)[0]
+
+
+def test_new_likes_are_stored_from_the_first_page():
+    sp = _synced_library('adds', 300)
+    for n in range(1000, 1003):
+        sp.like(n)
+
+    assert sync.sync_liked_tracks(sp, 'adds') == 'adds'
+    assert _stored('adds') == sp.keys()
+    assert sp.offsets == [0]
+
+
+def test_unliked_songs_are_dropped_without_a_full_fetch():
+    sp = _synced_library('removals', 10 * LIBRARY_BATCH_SIZE)
+    removed_before = METRICS.counter('sync.liked_tracks_removed')
+    for n in (17, 260, 480):
+        sp.unlike(n)
+
+    assert sync.sync_liked_tracks(sp, 'removals') == 'removals'
+    assert _stored('removals') == sp.keys()
+    assert len(sp.offsets) < 10
+    assert METRICS.counter('sync.liked_tracks_removed') == removed_before + 3
+
+
+def test_relike_moves_song_to_the_top():
+    sp = _synced_library('relikes', 300)
+    sp.like(120)
+
+    assert sync.sync_liked_tracks(sp, 'relikes') == 'relikes'
+    assert _stored('relikes') == sp.keys()
+    assert _stored('relikes')[0][1] == track(120)['uri']
+    assert len(_stored('relikes')) == 300
+
+
+def test_unstored_song_falls_back_to_the_api():
+    sp = _synced_library('unstored', 300)
+    # the store is missing a song the API lists ahead of the songs unliked
+    # since, so the removals cannot be located
+    keys = sp.keys()
+    METADATA_STORE.upsert_liked_tracks(
+        'unstored',
+        keys[:20] + keys[21:],
+        checked_at=time.time()
+    )
+    for _, n in [sp.liked[30], sp.liked[40]]:
+        sp.unlike(n)
+
+    assert sync.sync_liked_tracks(sp, 'unstored') == ''
+    tracks, total = sync.liked_tracks_range(sp, '', 0, LIBRARY_BATCH_SIZE)
+    assert [t.uri for t in tracks] == [uri for _, uri in sp.keys()[:LIBRARY_BATCH_SIZE]]
+    assert total == 298
+
+
+def test_reordered_songs_fall_back_to_the_api():
+    sp = _synced_library('reordered', 300)
+    # two songs listed in each other's place, just ahead of an unliked song
+    sp.liked[160], sp.liked[161] = sp.liked[161], sp.liked[160]
+    sp.unlike(sp.liked[170][1])
+
+    assert sync.sync_liked_tracks(sp, 'reordered') == ''